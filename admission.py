@@ -0,0 +1,212 @@
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request is over one of the admission limits"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class _TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token; returns 0 on success or the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AdmissionTicket:
+    """Resources held by one admitted request; release() gives them back"""
+
+    def __init__(self, controller: "AdmissionController", nbytes: int):
+        self.controller = controller
+        self.nbytes = nbytes
+        self.printer: Optional[str] = None
+        self._released = False
+
+    def enter_printer(self, printer: str, urgent: bool = False):
+        """Reserve a slot in the backlog of a printer
+
+        Urgent jobs are admitted over the backlog limit; the scheduler puts
+        them ahead of the bulk runs that fill it.
+        """
+        self.controller._enter_printer(printer, urgent)
+        self.printer = printer
+
+    @contextmanager
+    def decoding(self):
+        """Hold one of the in-flight decode slots while decoding/rasterizing"""
+        self.controller._enter_decode()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.controller._leave_decode(time.monotonic() - started)
+
+    @contextmanager
+    def printing(self):
+        """Time the printer session so Retry-After can be estimated"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.controller._record_print(self.printer, time.monotonic() - started)
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self.controller._release(self)
+
+
+class AdmissionController:
+    """Admission control for print requests
+
+    Limits the number of concurrent image decodes, the backlog of jobs per
+    printer, the total size of request bodies held in memory and optionally
+    the request rate per client (token bucket). A limit of 0 disables it.
+    Requests over a limit are rejected right away with an estimate of when to
+    retry, based on moving averages of the decode and print durations.
+    """
+
+    # Weight of the newest sample in the duration moving averages
+    EWMA_WEIGHT = 0.2
+
+    def __init__(
+        self,
+        max_decodes: int = 8,
+        max_printer_backlog: int = 32,
+        max_buffered_bytes: int = 128 * 1024 * 1024,
+        client_rate: float = 0,
+        client_burst: float = 20,
+    ):
+        self.max_decodes = max_decodes
+        self.max_printer_backlog = max_printer_backlog
+        self.max_buffered_bytes = max_buffered_bytes
+        self.client_rate = client_rate
+        self.client_burst = client_burst
+
+        self._lock = threading.Lock()
+        self._decodes = 0
+        self._buffered_bytes = 0
+        self._backlog: Dict[str, int] = {}
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._decode_seconds = 0.1
+        self._print_seconds: Dict[str, float] = {}
+
+    def admit(
+        self, client_id: Optional[str], nbytes: int, rate_limited: bool = True
+    ) -> AdmissionTicket:
+        """
+        Admit a request holding nbytes of payload in memory
+
+        Requests made of jobs admitted one by one pass rate_limited=False,
+        so only their jobs count against the client rate.
+
+        Raises:
+            AdmissionRejected: If the client rate or the buffered bytes limit is hit
+        """
+        with self._lock:
+            if self.client_rate > 0 and client_id and rate_limited:
+                bucket = self._buckets.get(client_id)
+                if bucket is None:
+                    if len(self._buckets) > 10000:
+                        self._prune_buckets()
+                    bucket = _TokenBucket(self.client_rate, self.client_burst)
+                    self._buckets[client_id] = bucket
+                wait = bucket.take()
+                if wait:
+                    raise AdmissionRejected(
+                        f"Rate limit of {self.client_rate}/s exceeded", wait
+                    )
+
+            if (
+                self.max_buffered_bytes
+                and self._buffered_bytes
+                and self._buffered_bytes + nbytes > self.max_buffered_bytes
+            ):
+                raise AdmissionRejected(
+                    "Too much image data in flight", self._average_print_seconds()
+                )
+            self._buffered_bytes += nbytes
+
+        return AdmissionTicket(self, nbytes)
+
+    def _prune_buckets(self):
+        """Forget clients whose bucket has refilled (lock must be held)"""
+        now = time.monotonic()
+        for client_id, bucket in list(self._buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst:
+                del self._buckets[client_id]
+
+    def _average_print_seconds(self) -> float:
+        if not self._print_seconds:
+            return 1.0
+        return sum(self._print_seconds.values()) / len(self._print_seconds)
+
+    def _enter_printer(self, printer: str, urgent: bool = False):
+        with self._lock:
+            backlog = self._backlog.get(printer, 0)
+            if (
+                self.max_printer_backlog
+                and backlog >= self.max_printer_backlog
+                and not urgent
+            ):
+                per_job = self._print_seconds.get(printer, 1.0)
+                raise AdmissionRejected(
+                    f"Printer '{printer}' has {backlog} jobs waiting",
+                    per_job * (backlog - self.max_printer_backlog + 1),
+                )
+            self._backlog[printer] = backlog + 1
+
+    def _enter_decode(self):
+        with self._lock:
+            if self.max_decodes and self._decodes >= self.max_decodes:
+                raise AdmissionRejected(
+                    "Too many images being processed", self._decode_seconds
+                )
+            self._decodes += 1
+
+    def _leave_decode(self, seconds: float):
+        with self._lock:
+            self._decodes -= 1
+            self._decode_seconds += self.EWMA_WEIGHT * (seconds - self._decode_seconds)
+
+    def _record_print(self, printer: Optional[str], seconds: float):
+        if printer is None:
+            return
+        with self._lock:
+            average = self._print_seconds.get(printer, seconds)
+            self._print_seconds[printer] = average + self.EWMA_WEIGHT * (
+                seconds - average
+            )
+
+    def _release(self, ticket: AdmissionTicket):
+        with self._lock:
+            self._buffered_bytes -= ticket.nbytes
+            if ticket.printer is not None:
+                backlog = self._backlog.get(ticket.printer, 1) - 1
+                if backlog > 0:
+                    self._backlog[ticket.printer] = backlog
+                else:
+                    self._backlog.pop(ticket.printer, None)
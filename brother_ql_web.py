@@ -5,28 +5,106 @@
 This is a web service to print labels on Brother QL label printers.
 """
 
-import sys, logging, random, json, argparse
-from typing import Dict, Any
+import sys, logging, random, json, argparse, socket, struct, threading, time
+import hmac
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Any, Optional, Tuple
 import base64
-from io import BytesIO
 
-from bottle import run, route, get, post, response, request, static_file
+from bottle import run, route, get, post, response, request, static_file, install
 from brother_ql.devicedependent import models
 from brother_ql.backends import backend_factory, guess_backend
-from jinja2 import Environment, FileSystemLoader
 import os
-from PIL import Image, ImageDraw
-
-from printer_service import LabelPrinterService
-from printer_manager import PrinterManager
+from PIL import Image, ImageDraw, UnidentifiedImageError
+
+from printer_service import (
+    LabelPrinterService,
+    CUT_MODES,
+    MAX_CUT_AT_END_LABELS,
+    count_pages,
+    media_fits,
+)
+from printer_manager import (
+    PrinterManager,
+    VALID_LABEL_SIZES,
+    AUTO_LABEL_SIZE,
+    FILTER_FIELDS,
+    LISTING_FIELDS,
+)
+from job_history import JobHistory
+from admission import AdmissionController, AdmissionRejected, AdmissionTicket
+from profiling import Profiler, stage
+from cluster import ClusterNode, SQLiteClusterStore
+from websocket_server import WebSocketPrintServer, parse_job_frame
+from static_assets import Asset, StaticAssets
+from idempotency import IdempotencyCache, RequestInProgress
+from http_server import KeepAliveRequestHandler, ThreadingWSGIServer
+from scheduler import PrintScheduler, PrintSlot, LANE_WEIGHTS, DEFAULT_PRIORITY
+from printer_status import PrinterStatusCache
 
 logger = logging.getLogger(__name__)
 
 printer_manager = None
-
-# Setup Jinja2 template environment
+job_history = None
+cluster_node = None
+admission = AdmissionController()
+profiler = Profiler()
+install(profiler.plugin)
+
+idempotency = IdempotencyCache()
+scheduler = PrintScheduler()
+printer_status = PrinterStatusCache()
+
+# Query parameters of file uploads to /api/print that are not strings
+UPLOAD_INT_PARAMETERS = ("threshold", "copies")
+UPLOAD_BOOL_PARAMETERS = ("raster", "prerasterized")
+UPLOAD_FLOAT_PARAMETERS = ("deadline",)
+# Job options sent along when an upload, batch or WebSocket job is forwarded
+# to the node owning the printer; the payload goes as "raster" or "image"
+FORWARDED_PARAMETERS = (
+    "label_size",
+    "threshold",
+    "rotate",
+    "copies",
+    "cut",
+    "priority",
+    "deadline",
+)
+
+# Test label rasters by (model, label size)
+test_rasters: Dict[Tuple[str, str], bytes] = {}
+test_rasters_lock = threading.Lock()
+# Printers test-printed at the same time by the fleet test print
+TEST_PRINT_WORKERS = 32
+
+# Token required for the /api/debug endpoints; they are disabled without one
+ADMIN_TOKEN = None
+
+# Most copies one print job may ask for
+MAX_COPIES = 1000
+
+# Rate limit clients by their X-Client-Id header instead of their address;
+# only safe behind a proxy that sets it
+TRUST_CLIENT_ID = False
+
+static_assets = StaticAssets(os.path.join(os.path.dirname(__file__), "static"))
+# Rendered once; the page loads everything that changes from the API
+page_shell: Optional[Asset] = None
+
+# Jinja2 template environment, created on first use to keep startup fast
 template_dir = os.path.join(os.path.dirname(__file__), "views")
-jinja_env = Environment(loader=FileSystemLoader(template_dir))
+jinja_env = None
+
+
+def get_jinja_env():
+    """Get the Jinja2 template environment"""
+    global jinja_env
+    if jinja_env is None:
+        from jinja2 import Environment, FileSystemLoader
+
+        jinja_env = Environment(loader=FileSystemLoader(template_dir))
+        jinja_env.globals["static_url"] = static_assets.url
+    return jinja_env
 
 
 def generate_test_image(width=300, height=150):
@@ -79,30 +157,25 @@ def generate_test_image(width=300, height=150):
     return image
 
 
-def image_to_base64(image):
-    """Convert PIL Image to base64 string"""
-    buffer = BytesIO()
-    image.save(buffer, format="PNG")
-    buffer.seek(0)
-    return base64.b64encode(buffer.getvalue()).decode("utf-8")
-
-
 @route("/")
 def index():
     """Serve the printer management interface"""
+    global page_shell
     try:
-        # Get available printers
-        printers = printer_manager.list_printers() if printer_manager else []
-
-        template = jinja_env.get_template("printer_management.jinja2")
-        return template.render(
-            website={
-                "HTML_TITLE": "Printer Manager",
-                "PAGE_TITLE": "Brother QL Printer Manager",
-                "PAGE_HEADLINE": "Manage your printers",
-            },
-            printers=printers,
-        )
+        if page_shell is None:
+            # Printers are loaded by the page itself from /api/printers
+            template = get_jinja_env().get_template("printer_management.jinja2")
+            html = template.render(
+                website={
+                    "HTML_TITLE": "Printer Manager",
+                    "PAGE_TITLE": "Brother QL Printer Manager",
+                    "PAGE_HEADLINE": "Manage your printers",
+                },
+            )
+            shell = Asset("index.html", html.encode("utf-8"), "text/html")
+            shell.compress()
+            page_shell = shell
+        return page_shell.respond()
     except Exception as e:
         logger.error(f"Error rendering printer management: {e}")
         return f"<h1>Error</h1><p>Failed to load printer management: {str(e)}</p>"
@@ -110,7 +183,10 @@ def index():
 
 @route("/static/<filename:path>")
 def serve_static(filename):
-    return static_file(filename, root="./static")
+    asset, hashed = static_assets.lookup(filename)
+    if not asset:
+        return static_file(filename, root="./static")
+    return asset.respond(immutable=hashed)
 
 
 @route("/api")
@@ -119,89 +195,1017 @@ def api_documentation():
     return static_file("API_DOCS.md", root=".")
 
 
-@post("/api/print")
-def print_label():
-    """Print a label directly via HTTP request"""
+def _print_and_record(
+    printer_service: LabelPrinterService,
+    raster_data: bytes,
+    printer_id: Optional[str],
+    printer_name: Optional[str],
+    label_size: str,
+    copies: int = 1,
+    cut: str = "each",
+    reprint_of: Optional[str] = None,
+    ticket: Optional[AdmissionTicket] = None,
+    slot: Optional[PrintSlot] = None,
+) -> Optional[str]:
+    """Print single-copy raster data and keep it in the job history"""
+
+    def record(status, error=None):
+        if not job_history:
+            return None
+        try:
+            with stage("history"):
+                return job_history.record_job(
+                    raster_data,
+                    printer_id,
+                    printer_name,
+                    printer_service.model,
+                    label_size,
+                    copies=copies,
+                    cut=cut,
+                    status=status,
+                    error=error,
+                    reprint_of=reprint_of,
+                )
+        except Exception as e:
+            logger.error(f"Failed to record print job: {e}")
+            return None
+
+    if slot is None:
+        slot = scheduler.slot(
+            printer_name or printer_service.printer_address, labels=copies
+        )
+
+    # Rasterized once; the copies go out over one printer connection in
+    # parts of chunk_labels labels, so long runs are never held in memory all
+    # at once. A run cut after every label makes way for a more urgent job
+    # waiting between two parts; a run cut at the end is one strip and keeps
+    # the printer
+    # Printers used with "auto" label sizes keep their status up to date
+    # (see _media_label_size)
+    track_status = printer_status.tracked(printer_service.printer_address)
+    chunk = scheduler.chunk_labels or copies
+    if cut == "end":
+        # Longer strips are made of several jobs, all but the last uncut
+        chunk = min(chunk, max(MAX_CUT_AT_END_LABELS // count_pages(raster_data), 1))
+    sent = 0
+
+    def parts():
+        nonlocal sent
+        while sent < copies:
+            part = min(chunk, copies - sent)
+            last = sent + part == copies
+            output = raster_data
+            if part > 1 or not last:
+                with stage("copies"):
+                    output = printer_service.repeat_label(
+                        raster_data, part, cut, last=last
+                    )
+            yield output
+            sent += part
+            if cut == "each" and not last and slot.more_urgent_waiting():
+                return
+
+    def send():
+        with stage("print"):
+            if ticket:
+                with ticket.printing():
+                    status = printer_service.print_raster(
+                        parts(), read_status=track_status
+                    )
+            else:
+                status = printer_service.print_raster(parts(), read_status=track_status)
+        if status:
+            printer_status.update(printer_service.printer_address, status)
+
     try:
-        data = request.json
+        while sent < copies:
+            started = sent
+            with slot.part(copies - sent):
+                send()
+                # The time per label is measured on the labels actually sent
+                slot.part(sent - started)
+    except Exception as e:
+        record("failed", str(e))
+        raise
 
-        if not data or "image" not in data:
-            response.status = 400
-            return {"error": "Image data is required"}
+    return record("printed")
+
+
+def _client_id() -> Optional[str]:
+    """Identify the client for per-client rate limits"""
+    if TRUST_CLIENT_ID:
+        return request.get_header("X-Client-Id") or request.remote_addr
+    return request.remote_addr
+
+
+def _forward_target(printer_id: Optional[str]) -> Optional[str]:
+    """URL of the cluster node owning a printer, if the job should go there"""
+    # Jobs forwarded by another node are printed here so they never bounce
+    if not cluster_node or cluster_node.is_forwarded(
+        request.get_header("X-Forwarded-By"), request.get_header("X-Cluster-Token")
+    ):
+        return None
+    return cluster_node.owner_url(printer_id)
+
+
+def _forward(owner_url: str, body: bytes):
+    """Relay a print request to the owning node and return its response"""
+    with stage("forward"):
+        status, result = cluster_node.forward(owner_url, "/api/print", body)
+    response.status = status
+    if "retry_after" in result:
+        response.set_header("Retry-After", str(result["retry_after"]))
+    return result
+
+
+def _admit_body(client_id: Optional[str], rate_limited: bool = True):
+    """
+    Admit the current request by its Content-Length, before reading the body
+
+    Raises:
+        AdmissionRejected: If the request is over an admission limit
+        PrintRequestError: If the body could never be admitted (413)
+    """
+    length = max(request.content_length, 0)
+    if admission.max_buffered_bytes and length > admission.max_buffered_bytes:
+        raise PrintRequestError("Request body is too large", 413)
+    return admission.admit(client_id, length, rate_limited=rate_limited)
+
+
+def _reject(e: AdmissionRejected):
+    """Turn an admission rejection into a 429 response"""
+    logger.info(f"Rejected request from {_client_id()}: {e.reason}")
+    response.status = 429
+    response.set_header("Retry-After", str(e.retry_after))
+    return {"error": e.reason, "retry_after": e.retry_after}
+
+
+class PrintRequestError(Exception):
+    """A print request that cannot be served, with the HTTP status to return"""
+
+    def __init__(
+        self, message: str, status: int = 400, retry_after: Optional[int] = None
+    ):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+def _check_copies(copies: Any):
+    """
+    Check the number of copies of a print request
+
+    Raises:
+        PrintRequestError: If it is not a positive integer up to MAX_COPIES
+    """
+    # bool is an int subclass; true is not a number of copies
+    if type(copies) is not int or copies < 1:
+        raise PrintRequestError("copies must be a positive integer")
+    if copies > MAX_COPIES:
+        raise PrintRequestError(f"copies must be at most {MAX_COPIES}", 413)
+
+
+def _resolve_print_job(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Resolve the printer and options of a print request
 
-        # Extract parameters with defaults from config
-        threshold = data.get("threshold", 70)
-        rotate = data.get("rotate", "auto")
-        printer_name = data.get("printer", None)
+    Raises:
+        PrintRequestError: If the printer is unknown or an option is invalid
+    """
+    printer_name = data.get("printer", None)
 
+    with stage("resolve_printer"):
         # Get the printer service and determine label size
+        printer_id = None
         if printer_name:
             printer_service = printer_manager.get_printer_service(printer_name)
             if not printer_service:
-                response.status = 400
-                return {"error": f"Printer '{printer_name}' not found"}
-
-            # Get printer ID to find default label size
-            printer_id = None
-            for printer in printer_manager.list_printers():
-                if printer["display_name"] == printer_name:
-                    printer_id = printer["printer_id"]
-                    break
-
-            # Use specified label size or printer's default
-            label_size = data.get(
-                "label_size",
-                (
-                    printer_manager.get_default_label_size(printer_id)
-                    if printer_id
-                    else "62"
-                ),
-            )
+                # Discovered by another node only; the job is forwarded there
+                if cluster_node:
+                    printer_id = cluster_node.remote_printer_id(printer_name)
+                if not printer_id:
+                    raise PrintRequestError(f"Printer '{printer_name}' not found")
         else:
             # Use default printer
-            default_printer = printer_manager.get_default_printer()
-            if not default_printer:
-                response.status = 400
-                return {"error": "No printers available"}
-            printer_service = printer_manager.get_printer_service(default_printer)
-
-            # Get default printer's default label size
-            printer_id = None
-            for printer in printer_manager.list_printers():
-                if printer["display_name"] == default_printer:
-                    printer_id = printer["printer_id"]
-                    break
-
-            label_size = data.get(
-                "label_size",
-                (
-                    printer_manager.get_default_label_size(printer_id)
-                    if printer_id
-                    else "62"
-                ),
+            printer_name = printer_manager.get_default_printer()
+            if not printer_name:
+                raise PrintRequestError("No printers available")
+            printer_service = printer_manager.get_printer_service(printer_name)
+
+        # Use specified label size or printer's default
+        printer_id = printer_id or printer_manager.get_printer_id(printer_name)
+        label_size = data.get(
+            "label_size",
+            (
+                printer_manager.get_default_label_size(printer_id)
+                if printer_id
+                else "62"
+            ),
+        )
+
+    copies = data.get("copies", 1)
+    cut = data.get("cut", "each")
+    _check_copies(copies)
+    if cut not in CUT_MODES:
+        raise PrintRequestError(f"cut must be one of: {', '.join(CUT_MODES)}")
+    priority, deadline = _job_priority(data)
+
+    return {
+        "printer_name": printer_name,
+        "printer_service": printer_service,
+        "printer_id": printer_id,
+        "label_size": label_size,
+        "copies": copies,
+        "cut": cut,
+        "priority": priority,
+        "deadline": deadline,
+        "threshold": data.get("threshold", 70),
+        "rotate": data.get("rotate", "auto"),
+    }
+
+
+def _check_local_printer(job: Dict[str, Any]):
+    """
+    Check a job not forwarded to another node can be printed here
+
+    Raises:
+        PrintRequestError: If the printer is only known to another node
+    """
+    if not job["printer_service"]:
+        raise PrintRequestError(f"Printer '{job['printer_name']}' not found")
+
+
+def _read_printer_status(
+    printer_name: str, printer_service: LabelPrinterService, refresh: bool = False
+) -> Dict[str, Any]:
+    """
+    The status of a printer, cached for a short time
+
+    Raises:
+        PrintRequestError: If the printer does not answer
+    """
+
+    def read():
+        # Not while a job is being sent, but before the jobs waiting for one
+        with stage("read_status"), scheduler.slot(printer_name, "urgent", labels=0):
+            return printer_service.read_status()
+
+    try:
+        return printer_status.get(printer_service.printer_address, read, refresh)
+    except Exception as e:
+        logger.warning(f"Could not read the status of '{printer_name}': {e}")
+        raise PrintRequestError(
+            f"Could not read the status of printer '{printer_name}'", 503
+        )
+
+
+def _media_label_size(
+    printer_name: str, printer_service: LabelPrinterService, label_size: str
+) -> str:
+    """
+    Resolve "auto" to the loaded media and check the media fits the job
+
+    Other label sizes are only checked against a status cached already, so
+    they never wait for the printer. Before a job is rejected the status is
+    read again, in case the roll was just changed.
+
+    Raises:
+        PrintRequestError: If the printer reports an error or other media
+    """
+    auto = label_size == AUTO_LABEL_SIZE
+    if auto:
+        printer_status.track(printer_service.printer_address)
+        status = _read_printer_status(printer_name, printer_service)
+    else:
+        status = printer_status.peek(printer_service.printer_address)
+        if status is None:
+            return label_size
+
+    def fits(status):
+        if status["errors"]:
+            return False
+        if auto:
+            return status["label_size"] is not None
+        return media_fits(label_size, status["media_width"], status["media_length"])
+
+    if not fits(status):
+        status = _read_printer_status(printer_name, printer_service, refresh=True)
+    if status["errors"]:
+        raise PrintRequestError(
+            f"Printer '{printer_name}' reports: {', '.join(status['errors'])}", 503
+        )
+    loaded = (
+        f"{status['media_width']}mm endless"
+        if not status["media_length"]
+        else f"{status['media_width']}x{status['media_length']}mm"
+    )
+    if auto:
+        if status["label_size"] is None:
+            raise PrintRequestError(
+                f"Printer '{printer_name}' has unknown media loaded ({loaded})"
+            )
+        return status["label_size"]
+    if not fits(status):
+        raise PrintRequestError(
+            f"Printer '{printer_name}' has {loaded} labels loaded, "
+            f"the job is for '{label_size}'"
+        )
+    return label_size
+
+
+def _job_priority(data: Dict[str, Any]) -> Tuple[str, Optional[float]]:
+    """
+    The priority lane and deadline of a print request
+
+    Raises:
+        PrintRequestError: If either is invalid
+    """
+    priority = data.get("priority", DEFAULT_PRIORITY)
+    deadline = data.get("deadline")
+    if priority not in LANE_WEIGHTS:
+        raise PrintRequestError(f"priority must be one of: {', '.join(LANE_WEIGHTS)}")
+    if deadline is not None and (
+        not isinstance(deadline, (int, float)) or isinstance(deadline, bool)
+    ):
+        raise PrintRequestError("deadline must be a Unix timestamp")
+    return priority, deadline
+
+
+def _job_slot(job: Dict[str, Any]) -> PrintSlot:
+    """The scheduler slot of a resolved print job"""
+    return scheduler.slot(
+        job["printer_name"], job["priority"], job["deadline"], job["copies"]
+    )
+
+
+def _rasterize_print_job(
+    job: Dict[str, Any],
+    payload: bytes,
+    ticket: AdmissionTicket,
+    raster: bool = False,
+    prerasterized: bool = False,
+) -> bytes:
+    """
+    Turn the image file data of a job, or finished raster data, into raster data
+
+    Raises:
+        PrintRequestError: If the image cannot be decoded or the raster data or
+            image does not fit the label
+    """
+    printer_service = job["printer_service"]
+    label_size = job["label_size"]
+
+    if raster:
+        # Finished raster instructions are validated and sent untouched
+        try:
+            with stage("validate_raster"):
+                printer_service.validate_raster(payload, label_size)
+        except ValueError as e:
+            raise PrintRequestError(str(e))
+        return payload
+
+    try:
+        printer_service.check_label_width(label_size)
+    except ValueError as e:
+        raise PrintRequestError(str(e))
+
+    with ticket.decoding(), stage("decode_render"):
+        try:
+            image = printer_service.decode_image(payload)
+        except UnidentifiedImageError:
+            raise PrintRequestError("Image data is not a supported image file")
+        if prerasterized:
+            if not printer_service.is_prerasterized(image, label_size):
+                raise PrintRequestError(
+                    f"Image is not a 1-bit bitmap of the printable width for label size '{label_size}'"
+                )
+            return printer_service.render_prerasterized(image, label_size)
+        return printer_service.render_label(
+            image, label_size, threshold=job["threshold"], rotate=job["rotate"]
+        )
+
+
+@post("/api/print")
+def print_label():
+    """Print a label directly via HTTP request"""
+    key = request.get_header("Idempotency-Key")
+    if not key:
+        return _print_request()
+
+    # A retried request gets the result of the first one instead of a new label
+    key = f"{_client_id()}:{key}"
+    try:
+        stored = idempotency.begin(key)
+    except RequestInProgress:
+        response.status = 409
+        response.set_header("Retry-After", "1")
+        return {"error": "A request with this Idempotency-Key is in progress"}
+    if stored:
+        response.status = stored[0]
+        response.set_header("Idempotent-Replayed", "true")
+        return stored[1]
+
+    result = None
+    try:
+        result = _print_request()
+        return result
+    finally:
+        # An exception that escaped the handler is a server error
+        idempotency.finish(
+            key, response.status_code if result is not None else 500, result
+        )
+
+
+def _print_request():
+    """Print the JSON or file upload print request"""
+    if not request.content_type.startswith("application/json"):
+        return _print_upload()
+
+    try:
+        # Checked before the body is parsed so overload costs next to nothing
+        ticket = _admit_body(_client_id())
+    except AdmissionRejected as e:
+        return _reject(e)
+    except PrintRequestError as e:
+        response.status = e.status
+        return {"error": str(e)}
+
+    try:
+        with stage("parse"):
+            data = request.json
+
+        if not data or ("image" not in data and "raster" not in data):
+            response.status = 400
+            return {"error": "Image data is required"}
+
+        job = _resolve_print_job(data)
+
+        owner_url = _forward_target(job["printer_id"])
+        if owner_url:
+            if data.get("printer"):
+                body = request.body.read()
+            else:
+                body = dict(data, printer=job["printer_name"])
+                body = json.dumps(body).encode("utf-8")
+            return _forward(owner_url, body)
+        _check_local_printer(job)
+
+        job["label_size"] = _media_label_size(
+            job["printer_name"], job["printer_service"], job["label_size"]
+        )
+        ticket.enter_printer(job["printer_name"], urgent=job["priority"] == "urgent")
+
+        printer_service = job["printer_service"]
+        try:
+            payload = printer_service.decode_base64_raster(
+                data["raster"] if "raster" in data else data["image"]
             )
+        except (TypeError, ValueError):
+            raise PrintRequestError("Image data must be base64 encoded")
+        raster_data = _rasterize_print_job(
+            job,
+            payload,
+            ticket,
+            raster="raster" in data,
+            prerasterized=bool(data.get("prerasterized")),
+        )
 
-        # Print the label directly
-        result = printer_service.print_label(
-            image_data=data["image"],
-            label_size=label_size,
-            threshold=threshold,
-            rotate=rotate,
+        slot = _job_slot(job)
+        job_id = _print_and_record(
+            printer_service,
+            raster_data,
+            job["printer_id"],
+            job["printer_name"],
+            job["label_size"],
+            job["copies"],
+            job["cut"],
+            ticket=ticket,
+            slot=slot,
         )
 
-        return {"success": True, "message": "Label printed successfully"}
+        logger.info(
+            f"Label printed successfully (size: {job['label_size']}, copies: {job['copies']}, cut: {job['cut']})"
+        )
+        return {
+            "success": True,
+            "message": "Label printed successfully",
+            "copies": job["copies"],
+            "label_size": job["label_size"],
+            "job_id": job_id,
+            **slot.report(),
+        }
+    except PrintRequestError as e:
+        response.status = e.status
+        return {"error": str(e)}
+    except AdmissionRejected as e:
+        return _reject(e)
     except Exception as e:
         logger.error(f"Error printing label: {e}")
         response.status = 500
         return {"error": str(e)}
+    finally:
+        ticket.release()
+
+
+def _print_upload():
+    """Print an image or raster file sent as the request body"""
+    params = {}
+    for name, value in request.query.items():
+        if name in UPLOAD_INT_PARAMETERS:
+            try:
+                value = int(value)
+            except ValueError:
+                response.status = 400
+                return {"error": f"{name} must be an integer"}
+        elif name in UPLOAD_FLOAT_PARAMETERS:
+            try:
+                value = float(value)
+            except ValueError:
+                response.status = 400
+                return {"error": f"{name} must be a number"}
+        elif name in UPLOAD_BOOL_PARAMETERS:
+            value = value.lower() in ("1", "true", "yes")
+        params[name] = value
+
+    try:
+        # Checked before the body is read so overload costs next to nothing
+        ticket = _admit_body(_client_id())
+    except AdmissionRejected as e:
+        return _reject(e)
+    except PrintRequestError as e:
+        response.status = e.status
+        return {"error": str(e)}
+
+    try:
+        with stage("parse"):
+            payload = request.body.read()
+        if not payload:
+            response.status = 400
+            return {"error": "Image data is required"}
+        status, result = _run_print_job(params, payload, _client_id(), ticket=ticket)
+    finally:
+        ticket.release()
+    response.status = status
+    if "retry_after" in result:
+        response.set_header("Retry-After", str(result["retry_after"]))
+    return result
+
+
+@post("/api/print/batch")
+def print_batch():
+    """Print many labels sent in one request body"""
+    client_id = _client_id()
+    try:
+        # The body is held while its jobs print; each job is rate limited
+        ticket = _admit_body(client_id, rate_limited=False)
+    except AdmissionRejected as e:
+        return _reject(e)
+    except PrintRequestError as e:
+        response.status = e.status
+        return {"error": str(e)}
+    try:
+        return _print_batch(client_id)
+    finally:
+        ticket.release()
+
+
+def _print_batch(client_id: Optional[str]):
+    body = request.body.read()
+    frames = []
+    offset = 0
+    while offset < len(body):
+        if offset + 4 > len(body):
+            response.status = 400
+            return {"error": "Truncated batch"}
+        (length,) = struct.unpack_from(">I", body, offset)
+        frames.append(body[offset + 4 : offset + 4 + length])
+        offset += 4 + length
+        if offset > len(body):
+            response.status = 400
+            return {"error": "Truncated batch"}
+    del body
+
+    results = []
+    for number, frame in enumerate(frames, 1):
+        try:
+            params, payload = parse_job_frame(frame)
+        except ValueError as e:
+            results.append({"id": number, "status": 400, "error": str(e)})
+            continue
+        job_ref = params.pop("id", number)
+        key = params.pop("idempotency_key", None)
+        status, result = _run_print_job(params, payload, client_id, key, buffered=True)
+        results.append({"id": job_ref, "status": status, **result})
+
+    printed = sum(result["status"] == 200 for result in results)
+    return {"results": results, "printed": printed, "failed": len(results) - printed}
+
+
+def _run_print_job(
+    params: Dict[str, Any],
+    payload: bytes,
+    client_id: Optional[str],
+    idempotency_key: Optional[str] = None,
+    ticket: Optional[AdmissionTicket] = None,
+    buffered: bool = False,
+) -> Tuple[int, Dict[str, Any]]:
+    """
+    Print a job, at most once per idempotency key; returns (status, body)
+
+    See _print_job for ticket and buffered.
+    """
+    if idempotency_key:
+        key = f"{client_id}:{idempotency_key}"
+        try:
+            stored = idempotency.begin(key)
+        except RequestInProgress:
+            return 409, {
+                "error": "A request with this Idempotency-Key is in progress",
+                "retry_after": 1,
+            }
+        if stored:
+            return stored
+
+    status, result = 500, {"error": "Print job did not finish"}
+    try:
+        result = dict(
+            success=True,
+            message="Label printed successfully",
+            **_print_job(params, payload, client_id, ticket, buffered),
+        )
+        status = 200
+    except PrintRequestError as e:
+        status, result = e.status, {"error": str(e)}
+        if e.retry_after:
+            result["retry_after"] = e.retry_after
+    except AdmissionRejected as e:
+        logger.info(f"Rejected job from {client_id}: {e.reason}")
+        status, result = 429, {"error": e.reason, "retry_after": e.retry_after}
+    except Exception as e:
+        logger.error(f"Error printing label: {e}")
+        result = {"error": str(e)}
+    finally:
+        if idempotency_key:
+            idempotency.finish(key, status, result)
+    return status, result
+
+
+def _print_job(
+    params: Dict[str, Any],
+    payload: bytes,
+    client_id: Optional[str],
+    ticket: Optional[AdmissionTicket] = None,
+    buffered: bool = False,
+) -> Dict[str, Any]:
+    """
+    Print one job given as parameters and image/raster data
+
+    Used for file uploads, batches and the WebSocket print channel.
+
+    Args:
+        ticket: Admission of the caller for this job, released by the caller
+        buffered: The payload is held by the caller's admission already
+
+    Raises:
+        PrintRequestError, AdmissionRejected: If the job is rejected
+    """
+    own_ticket = ticket is None
+    if own_ticket:
+        ticket = admission.admit(client_id, 0 if buffered else len(payload))
+    try:
+        job = _resolve_print_job(params)
+
+        owner_url = cluster_node.owner_url(job["printer_id"]) if cluster_node else None
+        if owner_url:
+            body = {
+                name: params[name] for name in FORWARDED_PARAMETERS if name in params
+            }
+            body["printer"] = job["printer_name"]
+            body["raster" if params.get("raster") else "image"] = base64.b64encode(
+                payload
+            ).decode("ascii")
+            if params.get("prerasterized"):
+                body["prerasterized"] = True
+            status, result = cluster_node.forward(
+                owner_url, "/api/print", json.dumps(body).encode("utf-8")
+            )
+            if status != 200:
+                raise PrintRequestError(
+                    result.get("error", "Forwarding failed"),
+                    status,
+                    result.get("retry_after"),
+                )
+            return {"job_id": result.get("job_id"), "copies": job["copies"]}
+        _check_local_printer(job)
+
+        job["label_size"] = _media_label_size(
+            job["printer_name"], job["printer_service"], job["label_size"]
+        )
+        ticket.enter_printer(job["printer_name"], urgent=job["priority"] == "urgent")
+        raster_data = _rasterize_print_job(
+            job,
+            payload,
+            ticket,
+            raster=bool(params.get("raster")),
+            prerasterized=bool(params.get("prerasterized")),
+        )
+        slot = _job_slot(job)
+        job_id = _print_and_record(
+            job["printer_service"],
+            raster_data,
+            job["printer_id"],
+            job["printer_name"],
+            job["label_size"],
+            job["copies"],
+            job["cut"],
+            ticket=ticket,
+            slot=slot,
+        )
+        return {
+            "job_id": job_id,
+            "copies": job["copies"],
+            "label_size": job["label_size"],
+            **slot.report(),
+        }
+    finally:
+        if own_ticket:
+            ticket.release()
+
+
+@get("/api/jobs")
+def list_jobs():
+    """List recent print jobs"""
+    try:
+        if not job_history:
+            response.status = 404
+            return {"error": "Job history is disabled"}
+
+        since = request.query.get("since")
+        before = request.query.get("before")
+        limit = int(request.query.get("limit", 50))
+        if limit < 1:
+            response.status = 400
+            return {"error": "limit must be a positive integer"}
+        jobs = job_history.list_jobs(
+            printer_id=request.query.get("printer_id") or None,
+            status=request.query.get("status") or None,
+            since=float(since) if since else None,
+            before=float(before) if before else None,
+            limit=min(limit, 500),
+        )
+        return {"jobs": jobs}
+    except ValueError as e:
+        response.status = 400
+        return {"error": f"Invalid query parameter: {e}"}
+    except Exception as e:
+        logger.error(f"Error listing jobs: {e}")
+        response.status = 500
+        return {"error": str(e)}
+
+
+@get("/api/jobs/<job_id>")
+def get_job(job_id):
+    """Get a single print job"""
+    try:
+        job = job_history.get_job(job_id) if job_history else None
+        if not job:
+            response.status = 404
+            return {"error": f"Job '{job_id}' not found"}
+        return {"job": job}
+    except Exception as e:
+        logger.error(f"Error getting job: {e}")
+        response.status = 500
+        return {"error": str(e)}
+
+
+@post("/api/jobs/<job_id>/reprint")
+def reprint_job(job_id):
+    """Reprint a stored job without rendering it again"""
+    try:
+        job = job_history.get_job(job_id) if job_history else None
+        raster_data = job_history.get_raster(job_id) if job else None
+        if not job or raster_data is None:
+            response.status = 404
+            return {"error": f"Job '{job_id}' not found"}
+
+        data = request.json or {}
+        copies = data.get("copies", job["copies"])
+        cut = data.get("cut", job["cut"] or "each")
+        try:
+            _check_copies(copies)
+        except PrintRequestError as e:
+            response.status = e.status
+            return {"error": str(e)}
+        if cut not in CUT_MODES:
+            response.status = 400
+            return {"error": f"cut must be one of: {', '.join(CUT_MODES)}"}
+        try:
+            priority, deadline = _job_priority(data)
+        except PrintRequestError as e:
+            response.status = e.status
+            return {"error": str(e)}
+
+        # Default to the printer the job was printed on
+        printer_name = data.get("printer") or printer_manager.printer_display_names.get(
+            job["printer_id"], job["printer_id"]
+        )
+        printer_id = printer_manager.get_printer_id(printer_name)
+        printer_service = (
+            printer_manager.get_printer_service(printer_name) if printer_id else None
+        )
+        if not printer_service:
+            response.status = 400
+            return {
+                "error": f"Printer '{printer_name or job['printer_name']}' not found"
+            }
+
+        try:
+            printer_service.validate_raster(raster_data, job["label_size"])
+        except ValueError as e:
+            response.status = 400
+            return {"error": f"Job is not compatible with '{printer_name}': {e}"}
+
+        owner_url = _forward_target(printer_id)
+        if owner_url:
+            body = {
+                "raster": base64.b64encode(raster_data).decode("ascii"),
+                "printer": printer_name,
+                "label_size": job["label_size"],
+                "copies": copies,
+                "cut": cut,
+                "priority": priority,
+                "deadline": deadline,
+            }
+            return _forward(owner_url, json.dumps(body).encode("utf-8"))
+
+        try:
+            _media_label_size(printer_name, printer_service, job["label_size"])
+        except PrintRequestError as e:
+            response.status = e.status
+            return {"error": str(e)}
+
+        ticket = admission.admit(_client_id(), len(raster_data))
+        try:
+            ticket.enter_printer(printer_name, urgent=priority == "urgent")
+            slot = scheduler.slot(printer_name, priority, deadline, copies)
+            new_job_id = _print_and_record(
+                printer_service,
+                raster_data,
+                printer_id,
+                printer_name,
+                job["label_size"],
+                copies,
+                cut,
+                reprint_of=job_id,
+                ticket=ticket,
+                slot=slot,
+            )
+        finally:
+            ticket.release()
+        return {
+            "success": True,
+            "message": f"Job reprinted on '{printer_name}'",
+            "job_id": new_job_id,
+            **slot.report(),
+        }
+    except AdmissionRejected as e:
+        return _reject(e)
+    except Exception as e:
+        logger.error(f"Error reprinting job: {e}")
+        response.status = 500
+        return {"error": str(e)}
+
+
+def _check_admin():
+    """Return an error response unless the request carries the admin token"""
+    if not ADMIN_TOKEN:
+        response.status = 403
+        return {"error": "Debug endpoints are disabled (no --admin-token set)"}
+    token = request.get_header("X-Admin-Token") or ""
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        response.status = 403
+        return {"error": "Admin token required"}
+    return None
+
+
+@post("/api/debug/profile")
+def start_profile():
+    """Profile the next N requests or T seconds of the running server"""
+    error = _check_admin()
+    if error:
+        return error
+    try:
+        data = request.json or {}
+        interval_ms = data.get("interval_ms", 5)
+        if (
+            not isinstance(interval_ms, (int, float))
+            or isinstance(interval_ms, bool)
+            or not 1 <= interval_ms <= 1000
+        ):
+            response.status = 400
+            return {"error": "interval_ms must be a number from 1 to 1000"}
+        session = profiler.start(
+            mode=data.get("mode", "cprofile"),
+            requests=data.get("requests"),
+            seconds=data.get("seconds"),
+            interval=interval_ms / 1000,
+        )
+        return {"success": True, "session": session}
+    except ValueError as e:
+        response.status = 400
+        return {"error": str(e)}
+    except Exception as e:
+        logger.error(f"Error starting profiler: {e}")
+        response.status = 500
+        return {"error": str(e)}
+
+
+@get("/api/debug/profile")
+def get_profile():
+    """Get the state or results of the last profiling session"""
+    error = _check_admin()
+    if error:
+        return error
+    return {"session": profiler.status()}
+
+
+@post("/api/debug/profile/stop")
+def stop_profile():
+    """Stop the running profiling session"""
+    error = _check_admin()
+    if error:
+        return error
+    return {"session": profiler.stop()}
+
+
+@get("/api/debug/slow-requests")
+def list_slow_requests():
+    """List the most recent requests slower than the configured threshold"""
+    error = _check_admin()
+    if error:
+        return error
+    return {
+        "threshold_ms": profiler.slow_request_threshold * 1000,
+        "requests": list(profiler.slow_requests),
+    }
+
+
+@get("/api/cluster")
+def cluster_status():
+    """Get the cluster nodes and which node owns each printer"""
+    if not cluster_node:
+        response.status = 404
+        return {"error": "Cluster mode is disabled"}
+    return cluster_node.status()
+
+
+@get("/api/queues")
+def print_queues():
+    """Get the jobs waiting for each printer by priority lane"""
+    return {"printers": scheduler.status(), "lane_weights": LANE_WEIGHTS}
 
 
 @get("/api/printers")
 def list_printers():
-    """List all available printers"""
+    """List available printers, optionally filtered, paginated and projected"""
     try:
-        printers = printer_manager.list_printers()
-        return {"printers": printers}
+        query = request.query
+        if not query:
+            return {"printers": printer_manager.list_printers()}
+
+        filters = {field: query[field] for field in FILTER_FIELDS if query.get(field)}
+        fields = [field for field in query.get("fields", "").split(",") if field]
+        unknown = [field for field in fields if field not in LISTING_FIELDS]
+        if unknown:
+            response.status = 400
+            return {"error": f"Unknown fields: {', '.join(unknown)}"}
+
+        limit = query.get("limit")
+        if limit:
+            try:
+                limit = int(limit)
+            except ValueError:
+                limit = 0
+            if limit < 1:
+                response.status = 400
+                return {"error": "limit must be a positive integer"}
+            limit = min(limit, 1000)
+        else:
+            limit = None
+
+        try:
+            printers, next_cursor = printer_manager.query_printers(
+                filters=filters,
+                name_prefix=query.get("name_prefix") or None,
+                cursor=query.get("cursor") or None,
+                limit=limit,
+                fields=fields or None,
+            )
+        except ValueError as e:
+            response.status = 400
+            return {"error": str(e)}
+
+        return {"printers": printers, "next_cursor": next_cursor}
     except Exception as e:
         logger.error(f"Error listing printers: {e}")
         response.status = 500
@@ -241,6 +1245,48 @@ def add_printer():
         return {"error": str(e)}
 
 
+@post("/api/printers/import")
+def import_printers():
+    """Add or update many manual printers in one transaction"""
+    try:
+        data = request.json
+
+        if not data or not isinstance(data.get("printers"), list):
+            response.status = 400
+            return {"error": "printers list is required"}
+
+        imported, errors = printer_manager.import_printers(
+            data["printers"], replace=bool(data.get("replace", False))
+        )
+
+        if errors:
+            response.status = 400
+            return {"error": "Invalid printer definitions", "errors": errors}
+
+        return {
+            "success": True,
+            "message": f"{imported} printers imported successfully",
+            "imported": imported,
+        }
+    except Exception as e:
+        logger.error(f"Error importing printers: {e}")
+        response.status = 500
+        return {"error": str(e)}
+
+
+@get("/api/printers/export")
+def export_printers():
+    """Export printer definitions for import on another server"""
+    try:
+        manual_only = request.query.get("all", "") not in ("1", "true")
+        printers, skipped = printer_manager.export_printers(manual_only)
+        return {"printers": printers, "skipped": skipped}
+    except Exception as e:
+        logger.error(f"Error exporting printers: {e}")
+        response.status = 500
+        return {"error": str(e)}
+
+
 @post("/api/printers/<printer_id>/display-name")
 def set_printer_display_name(printer_id):
     """Set display name for a printer"""
@@ -285,6 +1331,22 @@ def remove_printer(printer_id):
         return {"error": str(e)}
 
 
+def get_test_raster(printer_service: LabelPrinterService, label_size: str) -> bytes:
+    """Rasterized test label; it only depends on the model and label size"""
+    key = (printer_service.model, label_size)
+    raster_data = test_rasters.get(key)
+    if raster_data is None:
+        # Fleet test prints would otherwise render the same label many times
+        with test_rasters_lock:
+            raster_data = test_rasters.get(key)
+            if raster_data is None:
+                raster_data = printer_service.render_label(
+                    generate_test_image(), label_size, threshold=70, rotate="auto"
+                )
+                test_rasters[key] = raster_data
+    return raster_data
+
+
 @post("/api/printers/<printer_id>/test-print")
 def test_print_printer(printer_id):
     """Print a test label on a specific printer"""
@@ -292,12 +1354,10 @@ def test_print_printer(printer_id):
         # Get the printer display name
         display_name = None
         default_label_size = "62"  # fallback
-        printers = printer_manager.list_printers()
-        for printer in printers:
-            if printer["printer_id"] == printer_id:
-                display_name = printer["display_name"]
-                default_label_size = printer.get("default_label_size", "62")
-                break
+        snapshot = printer_manager.snapshot
+        if printer_id in snapshot.printers:
+            display_name = snapshot.display_names.get(printer_id, printer_id)
+            default_label_size = snapshot.default_label_sizes.get(printer_id, "62")
 
         if not display_name:
             response.status = 404
@@ -309,28 +1369,132 @@ def test_print_printer(printer_id):
             response.status = 400
             return {"error": f"Could not connect to printer '{display_name}'"}
 
-        # Generate test image
-        test_image = generate_test_image()
-        image_base64 = image_to_base64(test_image)
-
         # Print the test label using the printer's default label size
-        result = printer_service.print_label(
-            image_data=image_base64,
-            label_size=default_label_size,
-            threshold=70,
-            rotate="auto",
+        label_size = _media_label_size(
+            display_name, printer_service, default_label_size
         )
+        raster_data = get_test_raster(printer_service, label_size)
+        with scheduler.slot(display_name):
+            printer_service.print_raster(raster_data)
 
         return {
             "success": True,
-            "message": f"Test label printed successfully on '{display_name}' (size: {default_label_size})",
+            "message": f"Test label printed successfully on '{display_name}' (size: {label_size})",
         }
+    except PrintRequestError as e:
+        response.status = e.status
+        return {"error": str(e)}
     except Exception as e:
         logger.error(f"Error printing test label: {e}")
         response.status = 500
         return {"error": str(e)}
 
 
+@get("/api/printers/<printer_id>/status")
+def printer_status_info(printer_id):
+    """Get the loaded media and errors a printer reports"""
+    snapshot = printer_manager.snapshot
+    if printer_id not in snapshot.printers:
+        response.status = 404
+        return {"error": f"Printer with ID '{printer_id}' not found"}
+    display_name = snapshot.display_names.get(printer_id, printer_id)
+    printer_service = snapshot.services.get(display_name)
+    if not printer_service:
+        response.status = 400
+        return {"error": f"Could not connect to printer '{display_name}'"}
+    try:
+        return _read_printer_status(
+            display_name,
+            printer_service,
+            refresh=request.query.get("refresh") in ("1", "true"),
+        )
+    except PrintRequestError as e:
+        response.status = e.status
+        return {"error": str(e)}
+
+
+@post("/api/printers/test-print")
+def test_print_printers():
+    """Print a test label on many printers at once"""
+    try:
+        data = request.json or {}
+        filters = {field: data[field] for field in FILTER_FIELDS if data.get(field)}
+        timeout = data.get("timeout", 60)
+        if not isinstance(timeout, (int, float)) or timeout <= 0:
+            response.status = 400
+            return {"error": "timeout must be a positive number of seconds"}
+
+        snapshot = printer_manager.snapshot
+        printers, _ = snapshot.query(
+            filters=filters,
+            name_prefix=data.get("name_prefix") or None,
+            fields=["printer_id", "display_name", "default_label_size"],
+        )
+        if data.get("printer_ids"):
+            wanted = set(data["printer_ids"])
+            printers = [p for p in printers if p["printer_id"] in wanted]
+        if not printers:
+            return {"results": [], "printed": 0, "failed": 0}
+
+        def test_print(printer):
+            started = time.monotonic()
+            printer_service = snapshot.services[printer["display_name"]]
+            label_size = _media_label_size(
+                printer["display_name"],
+                printer_service,
+                printer["default_label_size"] or "62",
+            )
+            raster_data = get_test_raster(printer_service, label_size)
+            with scheduler.slot(printer["display_name"]):
+                printer_service.print_raster(raster_data)
+            return label_size, time.monotonic() - started
+
+        # Threads of printers that do not answer in time are left to finish
+        executor = ThreadPoolExecutor(
+            max_workers=min(TEST_PRINT_WORKERS, len(printers)),
+            thread_name_prefix="test-print",
+        )
+        futures = {
+            executor.submit(test_print, printer): printer for printer in printers
+        }
+        done, _ = wait(futures, timeout=timeout)
+        executor.shutdown(wait=False)
+
+        results = []
+        for future, printer in futures.items():
+            result = {
+                "printer_id": printer["printer_id"],
+                "display_name": printer["display_name"],
+            }
+            if future not in done:
+                result.update(success=False, error="Timed out")
+            elif future.exception():
+                result.update(success=False, error=str(future.exception()))
+            else:
+                label_size, seconds = future.result()
+                result.update(
+                    success=True,
+                    label_size=label_size,
+                    duration_ms=round(seconds * 1000, 1),
+                )
+            results.append(result)
+
+        printed = sum(result["success"] for result in results)
+        logger.info(f"Fleet test print: {printed} of {len(results)} printers succeeded")
+        return {
+            "results": results,
+            "printed": printed,
+            "failed": len(results) - printed,
+        }
+    except ValueError as e:
+        response.status = 400
+        return {"error": str(e)}
+    except Exception as e:
+        logger.error(f"Error printing test labels: {e}")
+        response.status = 500
+        return {"error": str(e)}
+
+
 @post("/api/printers/<printer_id>/default-label-size")
 def set_printer_default_label_size(printer_id):
     """Set default label size for a printer"""
@@ -344,30 +1508,10 @@ def set_printer_default_label_size(printer_id):
         label_size = data["default_label_size"]
 
         # Validate label size (basic validation)
-        valid_sizes = [
-            "12",
-            "29",
-            "38",
-            "50",
-            "54",
-            "62",
-            "62red",
-            "102",
-            "17x54",
-            "17x87",
-            "23x23",
-            "29x42",
-            "29x90",
-            "38x90",
-            "39x48",
-            "52x29",
-            "62x29",
-            "62x100",
-        ]
-        if label_size not in valid_sizes:
+        if label_size not in VALID_LABEL_SIZES:
             response.status = 400
             return {
-                "error": f"Invalid label size. Valid sizes: {', '.join(valid_sizes)}"
+                "error": f"Invalid label size. Valid sizes: {', '.join(VALID_LABEL_SIZES)}"
             }
 
         success = printer_manager.set_default_label_size(printer_id, label_size)
@@ -388,7 +1532,10 @@ def set_printer_default_label_size(printer_id):
 
 
 def main():
-    global DEBUG, BACKEND_CLASS, printer_manager
+    global DEBUG, BACKEND_CLASS, ADMIN_TOKEN, MAX_COPIES, TRUST_CLIENT_ID
+    global printer_manager, job_history
+    global admission, cluster_node, scheduler, printer_status
+    websocket_server = None
     parser = argparse.ArgumentParser(description=__doc__)
     parser.add_argument("--port", default=False)
     parser.add_argument(
@@ -406,6 +1553,124 @@ def main():
         action="store_true",
         help="Disable the printer service",
     )
+    parser.add_argument(
+        "--job-history-dir",
+        default="job_history",
+        help="Folder for the print job history (default: job_history)",
+    )
+    parser.add_argument(
+        "--job-history-max-mb",
+        type=int,
+        default=256,
+        help="Maximum size of stored job rasters in MB (default: 256)",
+    )
+    parser.add_argument(
+        "--job-history-max-age",
+        type=float,
+        default=168,
+        help="Maximum age of stored jobs in hours (default: 168)",
+    )
+    parser.add_argument(
+        "--disable-job-history",
+        action="store_true",
+        help="Do not keep a history of print jobs",
+    )
+    parser.add_argument(
+        "--max-inflight-decodes",
+        type=int,
+        default=8,
+        help="Images decoded at the same time before requests get 429 (0: no limit)",
+    )
+    parser.add_argument(
+        "--max-printer-backlog",
+        type=int,
+        default=32,
+        help="Jobs waiting per printer before requests get 429 (0: no limit)",
+    )
+    parser.add_argument(
+        "--max-buffered-mb",
+        type=int,
+        default=128,
+        help="Request data held in memory before requests get 429 (0: no limit)",
+    )
+    parser.add_argument(
+        "--client-rate-limit",
+        type=float,
+        default=0,
+        help="Print requests per second allowed per client (0: no limit)",
+    )
+    parser.add_argument(
+        "--client-burst",
+        type=float,
+        default=20,
+        help="Burst size of the per-client rate limit (default: 20)",
+    )
+    parser.add_argument(
+        "--trust-client-id",
+        action="store_true",
+        help="Rate limit clients by their X-Client-Id header instead of their address (only behind a proxy that sets it)",
+    )
+    parser.add_argument(
+        "--admin-token",
+        default=None,
+        help="Token (X-Admin-Token header) enabling the /api/debug endpoints",
+    )
+    parser.add_argument(
+        "--slow-request-ms",
+        type=float,
+        default=1000,
+        help="Log requests slower than this with per-stage timings (0: off)",
+    )
+    parser.add_argument(
+        "--profile-dir",
+        default="profiles",
+        help="Folder for profiling results (default: profiles)",
+    )
+    parser.add_argument(
+        "--cluster-store",
+        default=None,
+        help="SQLite file shared by all nodes; enables cluster mode",
+    )
+    parser.add_argument(
+        "--node-id",
+        default=None,
+        help="Unique name of this node in the cluster (default: hostname:port)",
+    )
+    parser.add_argument(
+        "--node-url",
+        default=None,
+        help="URL other nodes use to reach this node (default: http://hostname:port)",
+    )
+    parser.add_argument(
+        "--lease-ttl",
+        type=float,
+        default=10,
+        help="Seconds a node owns a printer without renewing (default: 10)",
+    )
+    parser.add_argument(
+        "--websocket-port",
+        type=int,
+        default=None,
+        help="Port for the WebSocket print channel (default: disabled)",
+    )
+    parser.add_argument(
+        "--status-ttl",
+        type=float,
+        default=30,
+        help="Seconds a printer status (loaded media) is cached (default: 30)",
+    )
+    parser.add_argument(
+        "--print-chunk-labels",
+        type=int,
+        default=20,
+        help="Labels of a multi-copy run built at once; urgent jobs waiting can print in between (default: 20, 0: whole run)",
+    )
+    parser.add_argument(
+        "--max-copies",
+        type=int,
+        default=1000,
+        help="Most copies of a label one print job may ask for (default: 1000)",
+    )
     parser.add_argument(
         "printer",
         nargs="?",
@@ -439,13 +1704,71 @@ def main():
         # Start discovery after initialization
         printer_manager.start_discovery()
 
+    ADMIN_TOKEN = args.admin_token
+    MAX_COPIES = args.max_copies
+    TRUST_CLIENT_ID = args.trust_client_id
+    profiler.output_dir = args.profile_dir
+    profiler.slow_request_threshold = args.slow_request_ms / 1000
+
+    admission = AdmissionController(
+        max_decodes=args.max_inflight_decodes,
+        max_printer_backlog=args.max_printer_backlog,
+        max_buffered_bytes=args.max_buffered_mb * 1024 * 1024,
+        client_rate=args.client_rate_limit,
+        client_burst=args.client_burst,
+    )
+    scheduler = PrintScheduler(chunk_labels=args.print_chunk_labels)
+    printer_status = PrinterStatusCache(ttl=args.status_ttl)
+
+    if not args.disable_job_history:
+        job_history = JobHistory(
+            args.job_history_dir,
+            max_bytes=args.job_history_max_mb * 1024 * 1024,
+            max_age=args.job_history_max_age * 3600,
+        )
+
+    if args.cluster_store and printer_manager:
+        hostname = socket.gethostname()
+        cluster_node = ClusterNode(
+            SQLiteClusterStore(args.cluster_store),
+            args.node_id or f"{hostname}:{PORT}",
+            args.node_url or f"http://{hostname}:{PORT}",
+            printer_manager,
+            lease_ttl=args.lease_ttl,
+        )
+        cluster_node.start()
+
+    # Compress the static files before the first dashboard asks for them
+    static_assets.load()
+
+    if args.websocket_port and printer_manager:
+        websocket_server = WebSocketPrintServer(
+            _print_job,
+            admission.admit,
+            port=args.websocket_port,
+            trust_client_id=args.trust_client_id,
+        )
+        websocket_server.start()
+
     try:
         # Start web server
-        run(host="0.0.0.0", port=PORT, debug=DEBUG)
+        run(
+            host="0.0.0.0",
+            port=PORT,
+            debug=DEBUG,
+            server_class=ThreadingWSGIServer,
+            handler_class=KeepAliveRequestHandler,
+        )
     finally:
         # Clean shutdown
+        if websocket_server:
+            websocket_server.stop()
+        if cluster_node:
+            cluster_node.stop()
         if printer_manager:
             printer_manager.shutdown()
+        if job_history:
+            job_history.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,461 @@
+import hashlib
+import hmac
+import json
+import logging
+import math
+import secrets
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ClusterStore(ABC):
+    """Storage shared by all nodes of a cluster
+
+    Holds the node membership, the printer leases, the shared printer
+    configuration and the secret nodes authenticate each other with.
+    Implementations must make acquire_leases atomic across nodes.
+    """
+
+    @abstractmethod
+    def heartbeat(self, node_id: str, url: str):
+        """Record that a node is alive and reachable at url"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_nodes(self, max_age: float) -> Dict[str, str]:
+        """Nodes seen within max_age seconds: node_id -> url"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def acquire_leases(
+        self, node_id: str, printer_ids: List[str], ttl: float
+    ) -> List[str]:
+        """Take or renew the leases that are free, expired or already ours"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def release_leases(self, node_id: str, printer_ids: Optional[List[str]] = None):
+        """Give up leases of a node (all of them if printer_ids is None)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_leases(self) -> Dict[str, Tuple[str, float]]:
+        """Unexpired leases: printer_id -> (node_id, expires_at)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_config(self) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """The shared printer configuration and its version"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def merge_config(self, changes: Dict[str, Dict[str, Any]]) -> int:
+        """
+        Apply changed entries to the shared printer configuration atomically
+
+        changes maps each section (display_names, pools, ...) to the entries
+        of printers that changed; None removes an entry. Entries of other
+        printers are kept as they are. Returns the new version.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def shared_secret(self) -> str:
+        """The cluster's secret, created by the first node asking for it"""
+        raise NotImplementedError
+
+
+class SQLiteClusterStore(ClusterStore):
+    """ClusterStore in a SQLite file, for nodes on one host or a shared volume"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, timeout=10, isolation_level=None, check_same_thread=False
+        )
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS nodes (
+                node_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                last_seen REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS leases (
+                printer_id TEXT PRIMARY KEY,
+                node_id TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS config (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL,
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS secret (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                value TEXT NOT NULL
+            );
+            """)
+
+    def heartbeat(self, node_id: str, url: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO nodes (node_id, url, last_seen) VALUES (?, ?, ?)",
+                (node_id, url, time.time()),
+            )
+
+    def list_nodes(self, max_age: float) -> Dict[str, str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT node_id, url FROM nodes WHERE last_seen >= ?",
+                (time.time() - max_age,),
+            ).fetchall()
+        return dict(rows)
+
+    def acquire_leases(
+        self, node_id: str, printer_ids: List[str], ttl: float
+    ) -> List[str]:
+        now = time.time()
+        acquired = []
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for printer_id in printer_ids:
+                    row = self._db.execute(
+                        "SELECT node_id, expires_at FROM leases WHERE printer_id = ?",
+                        (printer_id,),
+                    ).fetchone()
+                    if row is None or row[0] == node_id or row[1] < now:
+                        self._db.execute(
+                            "INSERT OR REPLACE INTO leases (printer_id, node_id, expires_at) "
+                            "VALUES (?, ?, ?)",
+                            (printer_id, node_id, now + ttl),
+                        )
+                        acquired.append(printer_id)
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return acquired
+
+    def release_leases(self, node_id: str, printer_ids: Optional[List[str]] = None):
+        with self._lock:
+            if printer_ids is None:
+                self._db.execute("DELETE FROM leases WHERE node_id = ?", (node_id,))
+            else:
+                self._db.executemany(
+                    "DELETE FROM leases WHERE node_id = ? AND printer_id = ?",
+                    [(node_id, printer_id) for printer_id in printer_ids],
+                )
+
+    def list_leases(self) -> Dict[str, Tuple[str, float]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT printer_id, node_id, expires_at FROM leases WHERE expires_at >= ?",
+                (time.time(),),
+            ).fetchall()
+        return {
+            printer_id: (node_id, expires_at)
+            for printer_id, node_id, expires_at in rows
+        }
+
+    def get_config(self) -> Tuple[int, Optional[Dict[str, Any]]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT version, data FROM config WHERE id = 1"
+            ).fetchone()
+        if not row:
+            return 0, None
+        return row[0], json.loads(row[1])
+
+    def merge_config(self, changes: Dict[str, Dict[str, Any]]) -> int:
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT version, data FROM config WHERE id = 1"
+                ).fetchone()
+                version = (row[0] if row else 0) + 1
+                data = json.loads(row[1]) if row else {}
+                for section, entries in changes.items():
+                    merged = data.setdefault(section, {})
+                    for key, value in entries.items():
+                        if value is None:
+                            merged.pop(key, None)
+                        else:
+                            merged[key] = value
+                self._db.execute(
+                    "INSERT OR REPLACE INTO config (id, version, data) VALUES (1, ?, ?)",
+                    (version, json.dumps(data)),
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return version
+
+    def shared_secret(self) -> str:
+        with self._lock:
+            # The first node's secret wins, later ones are ignored
+            self._db.execute(
+                "INSERT OR IGNORE INTO secret (id, value) VALUES (1, ?)",
+                (secrets.token_hex(32),),
+            )
+            return self._db.execute("SELECT value FROM secret WHERE id = 1").fetchone()[
+                0
+            ]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ClusterNode:
+    """Membership, printer ownership and job forwarding for one node
+
+    Every printer is owned by one node through a lease that the owner renews
+    on each heartbeat. Ownership is spread with rendezvous hashing over the
+    live nodes; when a node dies its leases expire and the next preferred
+    node takes them over. Print requests for a printer owned by another
+    node are forwarded to it. The printer configuration is shared through
+    the store and applied on every node.
+    """
+
+    def __init__(
+        self,
+        store: ClusterStore,
+        node_id: str,
+        url: str,
+        printer_manager,
+        lease_ttl: float = 10.0,
+    ):
+        self.store = store
+        self.node_id = node_id
+        self.url = url.rstrip("/")
+        self.printer_manager = printer_manager
+        self.lease_ttl = lease_ttl
+        self.interval = lease_ttl / 3
+        self._owners: Dict[str, Tuple[str, float]] = {}
+        self._nodes: Dict[str, str] = {}
+        self._config_version = 0
+        # The shared configuration as this node last applied or changed it
+        self._shared_config: Dict[str, Any] = {}
+        self._config_lock = threading.Lock()
+        self._secret = ""
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Join the cluster and start the heartbeat thread"""
+        self._secret = self.store.shared_secret()
+        self._pull_config()
+        self.printer_manager.on_config_saved = self._share_config
+
+        self._tick()
+        self._thread = threading.Thread(
+            target=self._run, name="cluster-heartbeat", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Cluster node {self.node_id} started ({self.url})")
+
+    def stop(self):
+        """Leave the cluster and hand over all leases right away"""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+        try:
+            self.store.release_leases(self.node_id)
+        except Exception as e:
+            logger.error(f"Failed to release cluster leases: {e}")
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._tick()
+            except Exception as e:
+                logger.error(f"Cluster heartbeat failed: {e}")
+
+    def _tick(self):
+        """Heartbeat, pull the shared config and rebalance printer leases"""
+        self.store.heartbeat(self.node_id, self.url)
+        nodes = self.store.list_nodes(self.lease_ttl)
+        nodes[self.node_id] = self.url
+
+        self._pull_config()
+
+        # Take the printers this node is preferred for, and release the
+        # ones another live node is preferred for
+        printer_ids = list(self.printer_manager.snapshot.printers)
+        wanted = [
+            p for p in printer_ids if self._preferred_node(p, nodes) == self.node_id
+        ]
+        wanted_set = set(wanted)
+        leases = self.store.list_leases()
+        handover = [
+            printer_id
+            for printer_id, (owner, _) in leases.items()
+            if owner == self.node_id and printer_id not in wanted_set
+        ]
+        if handover:
+            self.store.release_leases(self.node_id, handover)
+        # Printers whose owner is gone are taken over by any node seeing them
+        orphaned = [
+            p
+            for p in printer_ids
+            if p not in wanted_set and leases.get(p, (None,))[0] not in nodes
+        ]
+        self.store.acquire_leases(self.node_id, wanted + orphaned, self.lease_ttl)
+
+        self._nodes = nodes
+        self._owners = self.store.list_leases()
+
+    @staticmethod
+    def _preferred_node(printer_id: str, nodes: Dict[str, str]) -> str:
+        """Rendezvous hashing: the node with the highest score for a printer"""
+        return max(
+            nodes,
+            key=lambda node_id: hashlib.sha1(
+                f"{node_id}/{printer_id}".encode("utf-8")
+            ).digest(),
+        )
+
+    def _pull_config(self):
+        """Apply the shared configuration if another node changed it"""
+        with self._config_lock:
+            version, data = self.store.get_config()
+            if data is not None and version > self._config_version:
+                self.printer_manager.apply_shared_config(data)
+                self._shared_config = data
+                self._config_version = version
+
+    def _share_config(self, data: Dict[str, Any]):
+        """Merge the entries changed on this node into the shared configuration"""
+        try:
+            with self._config_lock:
+                changes = _config_changes(self._shared_config, data)
+                if not changes:
+                    return
+                version = self.store.merge_config(changes)
+                self._shared_config = data
+                # Changes merged in from other nodes are applied on the next pull
+                if version == self._config_version + 1:
+                    self._config_version = version
+        except Exception as e:
+            logger.error(f"Failed to share printer configuration: {e}")
+
+    def owner_url(self, printer_id: Optional[str]) -> Optional[str]:
+        """URL of the node owning a printer, or None if this node should print"""
+        if not printer_id:
+            return None
+        owner = self._owners.get(printer_id)
+        if not owner or owner[0] == self.node_id or owner[1] < time.time():
+            return None
+        return self._nodes.get(owner[0])
+
+    def remote_printer_id(self, printer_name: str) -> Optional[str]:
+        """
+        ID of a printer this node cannot see, if another node owns it
+
+        Discovered printers are only known to the nodes that see them, so
+        their display name is looked up in the shared configuration.
+        """
+        display_names = self.printer_manager.snapshot.display_names
+        candidates = [
+            printer_id
+            for printer_id, display_name in display_names.items()
+            if display_name == printer_name
+        ]
+        for printer_id in candidates or [printer_name]:
+            if self.owner_url(printer_id):
+                return printer_id
+        return None
+
+    def is_forwarded(self, node_id: Optional[str], token: Optional[str]) -> bool:
+        """Whether a request was forwarded by another node of this cluster"""
+        if not node_id or not token or not self._secret:
+            return False
+        return hmac.compare_digest(token, self._forward_token(node_id))
+
+    def _forward_token(self, node_id: str) -> str:
+        return hmac.new(
+            self._secret.encode("utf-8"), node_id.encode("utf-8"), hashlib.sha256
+        ).hexdigest()
+
+    def forward(
+        self, owner_url: str, path: str, body: bytes
+    ) -> Tuple[int, Dict[str, Any]]:
+        """
+        Send a JSON request to the owning node; returns its status and body
+
+        An unreachable owner gives a 503 to retry once its leases expired.
+        """
+        forward_request = urllib.request.Request(
+            owner_url + path,
+            data=body,
+            headers={
+                "Content-Type": "application/json",
+                "X-Forwarded-By": self.node_id,
+                "X-Cluster-Token": self._forward_token(self.node_id),
+            },
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(forward_request, timeout=60) as resp:
+                return resp.status, _decode_response(resp.status, resp.read())
+        except urllib.error.HTTPError as e:
+            return e.code, _decode_response(e.code, e.read())
+        except (urllib.error.URLError, OSError) as e:
+            logger.warning(f"Cannot forward to {owner_url}: {e}")
+            return 503, {
+                "error": "The node owning the printer is unreachable",
+                "retry_after": math.ceil(self.lease_ttl),
+            }
+
+    def status(self) -> Dict[str, Any]:
+        """Nodes and printer ownership as last seen by this node"""
+        now = time.time()
+        return {
+            "node_id": self.node_id,
+            "nodes": dict(self._nodes),
+            "leases": {
+                printer_id: {
+                    "node_id": node_id,
+                    "expires_in": round(expires_at - now, 1),
+                }
+                for printer_id, (node_id, expires_at) in self._owners.items()
+            },
+        }
+
+
+def _config_changes(
+    old: Dict[str, Any], new: Dict[str, Any]
+) -> Dict[str, Dict[str, Any]]:
+    """The entries of each configuration section that differ; None if removed"""
+    changes = {}
+    for section in set(old) | set(new):
+        before, after = old.get(section, {}), new.get(section, {})
+        changed = {
+            key: after.get(key)
+            for key in set(before) | set(after)
+            if before.get(key) != after.get(key)
+        }
+        if changed:
+            changes[section] = changed
+    return changes
+
+
+def _decode_response(status: int, body: bytes) -> Dict[str, Any]:
+    """The JSON body of a node's response, or an error for anything else"""
+    try:
+        result = json.loads(body or b"{}")
+    except ValueError:
+        result = None
+    if not isinstance(result, dict):
+        return {"error": f"Unexpected response from the owning node (HTTP {status})"}
+    return result
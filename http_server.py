@@ -0,0 +1,144 @@
+import logging
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler, WSGIServer
+
+logger = logging.getLogger(__name__)
+
+# Unread request bodies up to this size are skipped to keep the connection
+MAX_DRAIN_BYTES = 1024 * 1024
+# Seconds a connection may sit idle, between or within requests, before it
+# is closed and its thread freed
+IDLE_TIMEOUT = 30
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """wsgiref server handling every connection in its own thread"""
+
+    daemon_threads = True
+
+
+class _RequestBody:
+    """wsgi.input that stops at Content-Length and tracks what is left"""
+
+    def __init__(self, rfile, length: int):
+        self.rfile = rfile
+        self.remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.read(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def readline(self, size: int = -1) -> bytes:
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.rfile.readline(size) if size else b""
+        self.remaining -= len(data)
+        return data
+
+    def readlines(self, hint: int = -1):
+        return list(iter(self.readline, b""))
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+
+class _ServerHandler(ServerHandler):
+    http_version = "1.1"
+    completed = False
+
+    def cleanup_headers(self):
+        super().cleanup_headers()
+        request_handler = self.request_handler
+        # Without a length the end of the body is the end of the connection
+        if (
+            "Content-Length" not in self.headers
+            or getattr(self.stdin, "remaining", 0) > MAX_DRAIN_BYTES
+        ):
+            request_handler.close_connection = True
+        if request_handler.close_connection:
+            self.headers["Connection"] = "close"
+
+    def close(self):
+        self.completed = self.headers_sent
+        super().close()
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """wsgiref request handler keeping HTTP/1.1 connections open
+
+    Clients sending many requests reuse one connection instead of paying for
+    a TCP handshake per request. The connection is closed when the client
+    asks for it, when the response has no Content-Length, when an unread
+    request body is too large to skip or when the client stays silent for
+    IDLE_TIMEOUT seconds.
+    """
+
+    protocol_version = "HTTP/1.1"
+    timeout = IDLE_TIMEOUT
+
+    def address_string(self):
+        # No reverse DNS lookups
+        return self.client_address[0]
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection:
+            self.handle_one_request()
+
+    def handle_one_request(self):
+        try:
+            self._handle_one_request()
+        except TimeoutError:
+            logger.debug(f"Closing idle connection from {self.address_string()}")
+            self.close_connection = True
+
+    def _handle_one_request(self):
+        self.raw_requestline = self.rfile.readline(65537)
+        if not self.raw_requestline:
+            self.close_connection = True
+            return
+        if len(self.raw_requestline) > 65536:
+            self.requestline = ""
+            self.request_version = ""
+            self.command = ""
+            self.send_error(414)
+            self.close_connection = True
+            return
+
+        if not self.parse_request():  # An error code has been sent
+            self.close_connection = True
+            return
+
+        environ = self.get_environ()
+        body = None
+        if "chunked" in self.headers.get("Transfer-Encoding", "").lower():
+            # The application reads the chunks itself
+            self.close_connection = True
+        else:
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = 0
+                self.close_connection = True
+            body = _RequestBody(self.rfile, length)
+
+        handler = _ServerHandler(
+            body or self.rfile,
+            self.wfile,
+            self.get_stderr(),
+            environ,
+            multithread=True,
+        )
+        handler.request_handler = self  # backpointer for logging
+        handler.run(self.server.get_app())
+
+        if not handler.completed:
+            self.close_connection = True
+        elif not self.close_connection and body.remaining:
+            # Skip what the application did not read of the request body
+            while body.remaining and body.read(65536):
+                pass
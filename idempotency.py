@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+
+
+class RequestInProgress(Exception):
+    """Raised when a request with the same idempotency key is still running"""
+
+
+class IdempotencyCache:
+    """Results of recent requests by idempotency key
+
+    A client retrying a request whose response it never received sends the
+    same key again and gets the stored result instead of a second label.
+    Only results worth replaying are stored: server errors and rejections
+    the client should retry are forgotten, so the retry runs again.
+    """
+
+    def __init__(self, ttl: float = 600, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._results: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._in_progress = set()
+        self._lock = threading.Lock()
+
+    def begin(self, key: str) -> Optional[Tuple[int, Any]]:
+        """
+        Start a request; returns the stored (status, body) if it already ran
+
+        Raises:
+            RequestInProgress: If a request with this key is running
+        """
+        now = time.monotonic()
+        with self._lock:
+            # Entries are in insertion order, so expired ones are at the front
+            while self._results and next(iter(self._results.values()))[0] < now:
+                self._results.popitem(last=False)
+
+            stored = self._results.get(key)
+            if stored:
+                return stored[1], stored[2]
+            if key in self._in_progress:
+                raise RequestInProgress(key)
+            self._in_progress.add(key)
+        return None
+
+    def finish(self, key: str, status: int, body: Any):
+        """Store the result of a request started with begin()"""
+        with self._lock:
+            self._in_progress.discard(key)
+            if status >= 500 or status == 429:
+                return
+            self._results[key] = (time.monotonic() + self.ttl, status, body)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
@@ -0,0 +1,209 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Any
+
+logger = logging.getLogger(__name__)
+
+
+class JobHistory:
+    """Bounded history of print jobs with their rendered raster data
+
+    Job metadata lives in a SQLite database and the raster bytes of every job
+    are stored as one file per job next to it. Old jobs are evicted when the
+    stored rasters exceed max_bytes, when they are older than max_age seconds
+    or when there are more than max_jobs entries.
+    """
+
+    def __init__(
+        self,
+        directory: str = "job_history",
+        max_bytes: int = 256 * 1024 * 1024,
+        max_age: float = 7 * 24 * 3600,
+        max_jobs: int = 10000,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_jobs = max_jobs
+        self._lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(self.directory, "jobs.sqlite3"), check_same_thread=False
+        )
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                created_at REAL NOT NULL,
+                printer_id TEXT,
+                printer_name TEXT,
+                model TEXT,
+                label_size TEXT,
+                copies INTEGER NOT NULL DEFAULT 1,
+                cut TEXT,
+                status TEXT NOT NULL,
+                error TEXT,
+                raster_size INTEGER NOT NULL DEFAULT 0,
+                reprint_of TEXT
+            )
+            """)
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_created_at ON jobs (created_at)"
+        )
+        self._db.commit()
+
+        # Running totals so eviction does not have to scan the table
+        row = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(raster_size), 0) FROM jobs"
+        ).fetchone()
+        self._job_count, self._total_bytes = row[0], row[1]
+
+    def _raster_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.bin")
+
+    def record_job(
+        self,
+        raster_data: bytes,
+        printer_id: Optional[str],
+        printer_name: Optional[str],
+        model: str,
+        label_size: str,
+        copies: int = 1,
+        cut: str = "each",
+        status: str = "printed",
+        error: Optional[str] = None,
+        reprint_of: Optional[str] = None,
+    ) -> str:
+        """
+        Store a job and its single-copy raster data
+
+        Returns:
+            str: The id of the new job
+        """
+        job_id = uuid.uuid4().hex
+        with open(self._raster_path(job_id), "wb") as f:
+            f.write(raster_data)
+
+        with self._lock:
+            self._db.execute(
+                """
+                INSERT INTO jobs (job_id, created_at, printer_id, printer_name, model,
+                    label_size, copies, cut, status, error, raster_size, reprint_of)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job_id,
+                    time.time(),
+                    printer_id,
+                    printer_name,
+                    model,
+                    label_size,
+                    copies,
+                    cut,
+                    status,
+                    error,
+                    len(raster_data),
+                    reprint_of,
+                ),
+            )
+            self._db.commit()
+            self._job_count += 1
+            self._total_bytes += len(raster_data)
+            self._evict()
+
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Get the metadata of a job"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_raster(self, job_id: str) -> Optional[bytes]:
+        """Get the stored raster data of a job"""
+        try:
+            with open(self._raster_path(job_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def list_jobs(
+        self,
+        printer_id: Optional[str] = None,
+        status: Optional[str] = None,
+        since: Optional[float] = None,
+        before: Optional[float] = None,
+        limit: int = 50,
+    ) -> List[Dict[str, Any]]:
+        """List jobs, newest first"""
+        query = "SELECT * FROM jobs WHERE 1 = 1"
+        params: List[Any] = []
+        if printer_id:
+            query += " AND printer_id = ?"
+            params.append(printer_id)
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        if since is not None:
+            query += " AND created_at >= ?"
+            params.append(since)
+        if before is not None:
+            query += " AND created_at < ?"
+            params.append(before)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def _evict(self):
+        """Drop jobs beyond the age, count and size limits (lock must be held)"""
+        expired = self._db.execute(
+            "SELECT job_id, raster_size FROM jobs WHERE created_at < ?",
+            (time.time() - self.max_age,),
+        ).fetchall()
+        removed_bytes = sum(row["raster_size"] for row in expired)
+
+        excess_jobs = self._job_count - len(expired) - self.max_jobs
+        excess_bytes = self._total_bytes - removed_bytes - self.max_bytes
+        if excess_jobs > 0 or excess_bytes > 0:
+            # Walk the oldest remaining jobs until both limits hold again
+            for row in self._db.execute(
+                "SELECT job_id, raster_size FROM jobs WHERE created_at >= ? "
+                "ORDER BY created_at",
+                (time.time() - self.max_age,),
+            ):
+                if excess_jobs <= 0 and excess_bytes <= 0:
+                    break
+                expired.append(row)
+                excess_jobs -= 1
+                excess_bytes -= row["raster_size"]
+
+        if not expired:
+            return
+
+        self._db.executemany(
+            "DELETE FROM jobs WHERE job_id = ?", [(row["job_id"],) for row in expired]
+        )
+        self._db.commit()
+        self._job_count -= len(expired)
+        self._total_bytes -= sum(row["raster_size"] for row in expired)
+        for row in expired:
+            try:
+                os.remove(self._raster_path(row["job_id"]))
+            except FileNotFoundError:
+                pass
+        logger.info(f"Evicted {len(expired)} jobs from history")
+
+    def close(self):
+        """Close the history database"""
+        with self._lock:
+            self._db.close()
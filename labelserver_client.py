@@ -0,0 +1,561 @@
+"""
+Client for the label server print API.
+
+    from labelserver_client import LabelServerClient
+
+    with LabelServerClient("http://labelserver:8013") as client:
+        client.print_label(open("label.png", "rb").read(), printer="Packing 1")
+
+        # Labels submitted close together go out in one batch request
+        futures = [client.submit(png, label_size="62") for png in labels]
+        results = [future.result() for future in futures]
+
+AsyncLabelServerClient offers the same methods for asyncio code (it needs
+aiohttp). Images are uploaded as binary files, connections are kept open
+and reused, and requests are retried with the same idempotency key after
+connection errors, 429 responses and 503 responses carrying Retry-After,
+so a retry never prints a label twice. A 503 without Retry-After reports a
+printer fault (out of media, cover open) and is not retried.
+"""
+
+import asyncio
+import http.client
+import json
+import logging
+import queue
+import random
+import struct
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urlencode, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Statuses after which the same request can safely be sent again; 503 only
+# with a Retry-After, without one it reports a printer fault
+RETRY_STATUSES = (409, 429, 502, 503, 504)
+
+
+class LabelServerError(Exception):
+    """An error response of the label server"""
+
+    def __init__(self, status: int, message: str, retry_after: Optional[float] = None):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class Label:
+    """One label to print: image file data (or a PIL image) and its options
+
+    Options are those of POST /api/print: printer, label_size, threshold,
+    rotate, copies, cut, raster and prerasterized. Options left out use the
+    server defaults.
+    """
+
+    def __init__(self, image: Any, **options):
+        if hasattr(image, "save"):
+            # A PIL image; PNG keeps 1-bit images small
+            buffer = BytesIO()
+            image.save(buffer, format="PNG")
+            image = buffer.getvalue()
+        self.data: bytes = image
+        self.options = {k: v for k, v in options.items() if v is not None}
+        self.idempotency_key = uuid.uuid4().hex
+
+    def to_frame(self, job_id: int) -> bytes:
+        """Encode the label for the batch endpoint"""
+        header = json.dumps(
+            dict(self.options, id=job_id, idempotency_key=self.idempotency_key),
+            separators=(",", ":"),
+        ).encode("utf-8")
+        frame = struct.pack(">H", len(header)) + header + self.data
+        return struct.pack(">I", len(frame)) + frame
+
+    def query(self) -> str:
+        return urlencode(
+            {k: (int(v) if isinstance(v, bool) else v) for k, v in self.options.items()}
+        )
+
+
+class _RetryPolicy:
+    def __init__(self, retries: int, backoff: float, max_backoff: float = 30):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before retry number attempt (1 based)"""
+        delay = min(self.max_backoff, self.backoff * 2 ** (attempt - 1))
+        delay *= 0.5 + random.random() / 2
+        return max(delay, retry_after or 0)
+
+
+def _batch_body(labels: List[Label]) -> bytes:
+    return b"".join(label.to_frame(number) for number, label in enumerate(labels, 1))
+
+
+def _should_retry(status: int, retry_after: Any) -> bool:
+    if status == 503:
+        return retry_after is not None
+    return status in RETRY_STATUSES
+
+
+def _error_from(status: int, body: Dict[str, Any]) -> LabelServerError:
+    return LabelServerError(
+        status, body.get("error", "Request failed"), body.get("retry_after")
+    )
+
+
+class LabelServerClient:
+    """Thread-safe client with a pool of keep-alive connections
+
+    Args:
+        base_url: URL of the label server, e.g. http://labelserver:8013
+        timeout: Seconds to wait for a response (printing takes a while)
+        retries: How often a failed request is retried
+        backoff: Base delay between retries, doubled on every attempt
+        pool_size: Connections kept open for reuse
+        batch_size: Most labels sent in one request by submit()
+        linger: Seconds submit() waits for more labels before sending a batch
+        client_id: Sent as X-Client-Id, e.g. for per-client rate limits
+            behind a proxy (see --trust-client-id)
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 60,
+        retries: int = 3,
+        backoff: float = 0.5,
+        pool_size: int = 4,
+        batch_size: int = 50,
+        linger: float = 0.02,
+        client_id: Optional[str] = None,
+    ):
+        url = urlsplit(base_url)
+        self._connection_class = (
+            http.client.HTTPSConnection
+            if url.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self._netloc = url.netloc
+        self._path = url.path.rstrip("/")
+        self.timeout = timeout
+        self.retry_policy = _RetryPolicy(retries, backoff)
+        self.batch_size = batch_size
+        self.linger = linger
+        self.headers = {"X-Client-Id": client_id} if client_id else {}
+        self._pool: "queue.LifoQueue[http.client.HTTPConnection]" = queue.LifoQueue(
+            pool_size
+        )
+        self._pending: List[Tuple[Label, Future]] = []
+        self._pending_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Send labels still waiting for a batch and close all connections"""
+        self.flush()
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _request_once(
+        self, method: str, path: str, body: Optional[bytes], headers: Dict[str, str]
+    ) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        try:
+            connection = self._pool.get_nowait()
+        except queue.Empty:
+            connection = self._connection_class(self._netloc, timeout=self.timeout)
+        try:
+            connection.request(method, self._path + path, body=body, headers=headers)
+            resp = connection.getresponse()
+            data = resp.read()
+        except Exception:
+            connection.close()
+            raise
+        if resp.will_close:
+            connection.close()
+        else:
+            try:
+                self._pool.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+        try:
+            result = json.loads(data) if data else {}
+        except ValueError:
+            result = {"error": data.decode("utf-8", "replace")}
+        return resp.status, result, dict(resp.getheaders())
+
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Send a request, retrying connection errors and retryable statuses
+
+        Only send requests that are safe to repeat (reads, or writes carrying
+        an Idempotency-Key).
+
+        Raises:
+            LabelServerError: For error responses
+        """
+        headers = dict(self.headers, **(headers or {}))
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                status, result, response_headers = self._request_once(
+                    method, path, body, headers
+                )
+            except (OSError, http.client.HTTPException) as e:
+                if attempt > self.retry_policy.retries:
+                    raise
+                delay = self.retry_policy.delay(attempt)
+                logger.warning(
+                    f"Request to {path} failed ({e}), retrying in {delay:.1f}s"
+                )
+                time.sleep(delay)
+                continue
+
+            if status < 400:
+                return result
+            error = _error_from(status, result)
+            retry_after = response_headers.get("Retry-After") or error.retry_after
+            if (
+                not _should_retry(status, retry_after)
+                or attempt > self.retry_policy.retries
+            ):
+                raise error
+            delay = self.retry_policy.delay(attempt, float(retry_after or 0))
+            logger.warning(f"Request to {path} got {status}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+    def print_label(self, image: Any, **options) -> Dict[str, Any]:
+        """Print one label right away; returns the server response"""
+        label = image if isinstance(image, Label) else Label(image, **options)
+        query = label.query()
+        return self.request(
+            "POST",
+            "/api/print" + (f"?{query}" if query else ""),
+            body=label.data,
+            headers={
+                "Content-Type": "application/octet-stream",
+                "Idempotency-Key": label.idempotency_key,
+            },
+        )
+
+    def print_batch(self, labels: List[Label]) -> List[Dict[str, Any]]:
+        """
+        Print labels in as few requests as possible
+
+        Returns one result per label, in order. Labels the server could not
+        take yet (429, or 503 with a retry_after) are sent again; other failures are returned as results
+        with an "error" and the HTTP "status".
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(labels)
+        for start in range(0, len(labels), self.batch_size):
+            pending = list(range(start, min(start + self.batch_size, len(labels))))
+            attempt = 0
+            while pending:
+                attempt += 1
+                response = self.request(
+                    "POST",
+                    "/api/print/batch",
+                    body=_batch_body([labels[i] for i in pending]),
+                    headers={"Content-Type": "application/octet-stream"},
+                )
+                retry, retry_after = [], 0
+                for index, result in zip(pending, response["results"]):
+                    results[index] = result
+                    if (
+                        _should_retry(result["status"], result.get("retry_after"))
+                        and attempt <= self.retry_policy.retries
+                    ):
+                        retry.append(index)
+                        retry_after = max(retry_after, result.get("retry_after") or 0)
+                pending = retry
+                if pending:
+                    time.sleep(self.retry_policy.delay(attempt, retry_after))
+        return results
+
+    def submit(self, image: Any, **options) -> "Future[Dict[str, Any]]":
+        """
+        Queue a label for the next batch; returns a Future of its result
+
+        Labels submitted within `linger` seconds of each other, up to
+        batch_size, are sent in a single request. The Future raises
+        LabelServerError if the label could not be printed.
+        """
+        label = image if isinstance(image, Label) else Label(image, **options)
+        future: "Future[Dict[str, Any]]" = Future()
+        with self._pending_lock:
+            self._pending.append((label, future))
+            if len(self._pending) >= self.batch_size:
+                batch, self._pending = self._pending, []
+            else:
+                batch = None
+                if self._flush_timer is None:
+                    self._flush_timer = threading.Timer(self.linger, self.flush)
+                    self._flush_timer.daemon = True
+                    self._flush_timer.start()
+        if batch:
+            threading.Thread(
+                target=self._send_batch, args=(batch,), daemon=True
+            ).start()
+        return future
+
+    def flush(self):
+        """Send the labels waiting for a batch now"""
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        if batch:
+            self._send_batch(batch)
+
+    def _send_batch(self, batch: List[Tuple[Label, Future]]):
+        try:
+            results = self.print_batch([label for label, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if result.get("status") == 200:
+                future.set_result(result)
+            else:
+                future.set_exception(_error_from(result.get("status", 500), result))
+
+    def list_printers(self, **filters) -> List[Dict[str, Any]]:
+        """List printers; filters are the query parameters of GET /api/printers"""
+        query = urlencode({k: v for k, v in filters.items() if v is not None})
+        return self.request("GET", "/api/printers" + (f"?{query}" if query else ""))[
+            "printers"
+        ]
+
+    def get_job(self, job_id: str) -> Dict[str, Any]:
+        """Get a job from the server's job history"""
+        return self.request("GET", f"/api/jobs/{job_id}")["job"]
+
+
+class AsyncLabelServerClient:
+    """asyncio client on an aiohttp session with keep-alive connections
+
+    Takes the same arguments as LabelServerClient; use it as an async
+    context manager or call close().
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        timeout: float = 60,
+        retries: int = 3,
+        backoff: float = 0.5,
+        pool_size: int = 4,
+        batch_size: int = 50,
+        linger: float = 0.02,
+        client_id: Optional[str] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.retry_policy = _RetryPolicy(retries, backoff)
+        self.batch_size = batch_size
+        self.linger = linger
+        self.headers = {"X-Client-Id": client_id} if client_id else {}
+        self._session = None
+        self._pending: List[Tuple[Label, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # Batches on their way; referenced so they are not garbage collected
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def _get_session(self):
+        if self._session is None:
+            import aiohttp
+
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=self.headers,
+            )
+        return self._session
+
+    async def close(self):
+        """Send labels still waiting for a batch, wait for all batches and close"""
+        await self.flush()
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        """Send a request with retries (see LabelServerClient.request)"""
+        import aiohttp
+
+        session = self._get_session()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with session.request(
+                    method, self.base_url + path, data=body, headers=headers
+                ) as resp:
+                    data = await resp.read()
+                    status = resp.status
+                    retry_after = resp.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt > self.retry_policy.retries:
+                    raise
+                delay = self.retry_policy.delay(attempt)
+                logger.warning(
+                    f"Request to {path} failed ({e}), retrying in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+                continue
+
+            try:
+                result = json.loads(data) if data else {}
+            except ValueError:
+                result = {"error": data.decode("utf-8", "replace")}
+            if status < 400:
+                return result
+            error = _error_from(status, result)
+            retry_after = retry_after or error.retry_after
+            if (
+                not _should_retry(status, retry_after)
+                or attempt > self.retry_policy.retries
+            ):
+                raise error
+            delay = self.retry_policy.delay(attempt, float(retry_after or 0))
+            logger.warning(f"Request to {path} got {status}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def print_label(self, image: Any, **options) -> Dict[str, Any]:
+        """Print one label right away; returns the server response"""
+        label = image if isinstance(image, Label) else Label(image, **options)
+        query = label.query()
+        return await self.request(
+            "POST",
+            "/api/print" + (f"?{query}" if query else ""),
+            body=label.data,
+            headers={
+                "Content-Type": "application/octet-stream",
+                "Idempotency-Key": label.idempotency_key,
+            },
+        )
+
+    async def print_batch(self, labels: List[Label]) -> List[Dict[str, Any]]:
+        """Print labels in as few requests as possible (see LabelServerClient)"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(labels)
+        for start in range(0, len(labels), self.batch_size):
+            pending = list(range(start, min(start + self.batch_size, len(labels))))
+            attempt = 0
+            while pending:
+                attempt += 1
+                response = await self.request(
+                    "POST",
+                    "/api/print/batch",
+                    body=_batch_body([labels[i] for i in pending]),
+                    headers={"Content-Type": "application/octet-stream"},
+                )
+                retry, retry_after = [], 0
+                for index, result in zip(pending, response["results"]):
+                    results[index] = result
+                    if (
+                        _should_retry(result["status"], result.get("retry_after"))
+                        and attempt <= self.retry_policy.retries
+                    ):
+                        retry.append(index)
+                        retry_after = max(retry_after, result.get("retry_after") or 0)
+                pending = retry
+                if pending:
+                    await asyncio.sleep(self.retry_policy.delay(attempt, retry_after))
+        return results
+
+    def submit(self, image: Any, **options) -> "asyncio.Future[Dict[str, Any]]":
+        """Queue a label for the next batch; returns a future of its result"""
+        label = image if isinstance(image, Label) else Label(image, **options)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((label, future))
+        if len(self._pending) >= self.batch_size:
+            batch, self._pending = self._pending, []
+            self._start(self._send_batch(batch))
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                self.linger, lambda: self._start(self.flush())
+            )
+        return future
+
+    def _start(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        """Send the labels waiting for a batch now"""
+        batch, self._pending = self._pending, []
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if batch:
+            await self._send_batch(batch)
+
+    async def _send_batch(self, batch: List[Tuple[Label, asyncio.Future]]):
+        try:
+            results = await self.print_batch([label for label, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if result.get("status") == 200:
+                future.set_result(result)
+            else:
+                future.set_exception(_error_from(result.get("status", 500), result))
+
+    async def list_printers(self, **filters) -> List[Dict[str, Any]]:
+        """List printers; filters are the query parameters of GET /api/printers"""
+        query = urlencode({k: v for k, v in filters.items() if v is not None})
+        result = await self.request(
+            "GET", "/api/printers" + (f"?{query}" if query else "")
+        )
+        return result["printers"]
+
+    async def get_job(self, job_id: str) -> Dict[str, Any]:
+        """Get a job from the server's job history"""
+        return (await self.request("GET", f"/api/jobs/{job_id}"))["job"]
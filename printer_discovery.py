@@ -1,10 +1,14 @@
 import logging
 import threading
 import time
-from typing import Dict, List, Optional, Callable
-from zeroconf import ServiceBrowser, ServiceListener, Zeroconf
+from concurrent.futures import ThreadPoolExecutor
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Dict, List, Mapping, Optional, Callable
 import socket
 
+if TYPE_CHECKING:
+    from zeroconf import Zeroconf
+
 logger = logging.getLogger(__name__)
 
 
@@ -29,13 +33,24 @@ class PrinterInfo:
         }
 
 
-class PrinterDiscoveryService(ServiceListener):
+class PrinterDiscoveryService:
+    """Discovers Brother QL printers via zeroconf and keeps manual printers
+
+    The printers mapping is copy-on-write: every change publishes a new
+    read-only mapping, so readers never take a lock. PrinterInfo objects are
+    not modified once published. Callbacks run after the lock is released.
+
+    Printers remembered from a previous run can be added with the "Cached"
+    status until zeroconf finds them again. zeroconf itself is only imported
+    when discovery starts.
+    """
+
     def __init__(
         self,
         on_printer_found: Optional[Callable] = None,
         on_printer_removed: Optional[Callable] = None,
     ):
-        self.printers: Dict[str, PrinterInfo] = {}
+        self.printers: Mapping[str, PrinterInfo] = MappingProxyType({})
         self.zeroconf = None
         self.browser = None
         self.on_printer_found = on_printer_found
@@ -44,8 +59,10 @@ class PrinterDiscoveryService(ServiceListener):
 
     def start_discovery(self):
         """Start the printer discovery service"""
-        print("Starting printer discovery service")
+        logger.debug("Starting printer discovery service")
         try:
+            from zeroconf import ServiceBrowser, Zeroconf
+
             self.zeroconf = Zeroconf()
             # Brother printers typically advertise on these service types
             service_types = [
@@ -72,9 +89,9 @@ class PrinterDiscoveryService(ServiceListener):
         except Exception as e:
             logger.error(f"Failed to stop printer discovery: {e}")
 
-    def add_service(self, zc: Zeroconf, type_: str, name: str) -> None:
+    def add_service(self, zc: "Zeroconf", type_: str, name: str) -> None:
         """Called when a new service is discovered"""
-        print(f"Discovered service: {name}")
+        logger.debug(f"Discovered service: {name}")
         try:
             info = zc.get_service_info(type_, name)
             if info and self._is_brother_printer(info):
@@ -90,7 +107,13 @@ class PrinterDiscoveryService(ServiceListener):
 
                     printer_info = PrinterInfo(printer_name, address, port, model)
                     with self._lock:
-                        self.printers[printer_name] = printer_info
+                        current = self.printers.get(printer_name)
+                        if current and current.status == "Manual":
+                            # Manually configured printers take precedence
+                            return
+                        self._replace_printers(
+                            {**self.printers, printer_name: printer_info}
+                        )
 
                     logger.info(
                         f"Discovered Brother printer: {printer_name} at {address}:{port}"
@@ -102,7 +125,7 @@ class PrinterDiscoveryService(ServiceListener):
         except Exception as e:
             logger.error(f"Error adding service {name}: {e}")
 
-    def remove_service(self, zc: Zeroconf, type_: str, name: str) -> None:
+    def remove_service(self, zc: "Zeroconf", type_: str, name: str) -> None:
         """Called when a service is removed"""
         try:
             # Find printer by service name
@@ -114,7 +137,12 @@ class PrinterDiscoveryService(ServiceListener):
 
             if printer_to_remove:
                 with self._lock:
-                    removed_printer = self.printers.pop(printer_to_remove)
+                    removed_printer = self.printers.get(printer_to_remove)
+                    if not removed_printer or removed_printer.status == "Manual":
+                        return
+                    printers = dict(self.printers)
+                    del printers[printer_to_remove]
+                    self._replace_printers(printers)
                 logger.info(f"Removed printer: {printer_to_remove}")
 
                 if self.on_printer_removed:
@@ -123,7 +151,7 @@ class PrinterDiscoveryService(ServiceListener):
         except Exception as e:
             logger.error(f"Error removing service {name}: {e}")
 
-    def update_service(self, zc: Zeroconf, type_: str, name: str) -> None:
+    def update_service(self, zc: "Zeroconf", type_: str, name: str) -> None:
         """Called when a service is updated"""
         # Treat updates as add operations
         self.add_service(zc, type_, name)
@@ -181,24 +209,120 @@ class PrinterDiscoveryService(ServiceListener):
         except:
             return "Unknown"
 
-    def get_printers(self) -> Dict[str, PrinterInfo]:
-        """Get all discovered printers"""
-        with self._lock:
-            return self.printers.copy()
+    def _replace_printers(self, printers: Dict[str, PrinterInfo]):
+        """Publish a new printers mapping (lock must be held)"""
+        self.printers = MappingProxyType(printers)
+
+    def get_printers(self) -> Mapping[str, PrinterInfo]:
+        """Get all discovered printers as a read-only snapshot"""
+        return self.printers
 
     def get_printer(self, name: str) -> Optional[PrinterInfo]:
         """Get a specific printer by name"""
-        with self._lock:
-            return self.printers.get(name)
+        return self.printers.get(name)
 
     def add_manual_printer(
         self, name: str, address: str, port: int = 9100, model: str = "QL-500"
     ):
         """Manually add a printer"""
+        printer_info = PrinterInfo(name, address, port, model)
+        printer_info.status = "Manual"
         with self._lock:
-            printer_info = PrinterInfo(name, address, port, model)
-            self.printers[name] = printer_info
-            logger.info(f"Manually added printer: {name} at {address}:{port}")
+            self._replace_printers({**self.printers, name: printer_info})
+        logger.info(f"Manually added printer: {name} at {address}:{port}")
 
-            if self.on_printer_found:
-                self.on_printer_found(printer_info)
+        if self.on_printer_found:
+            self.on_printer_found(printer_info)
+
+    def add_manual_printers(self, printers: List[PrinterInfo]):
+        """Add many manual printers at once
+
+        The printers are published in a single update and on_printer_found is
+        not called; the caller takes care of updating its own state.
+        """
+        with self._lock:
+            updated = dict(self.printers)
+            for printer_info in printers:
+                printer_info.status = "Manual"
+                updated[printer_info.name] = printer_info
+            self._replace_printers(updated)
+        logger.info(f"Manually added {len(printers)} printers")
+
+    def remove_manual_printers(self, names: List[str]) -> List[PrinterInfo]:
+        """Remove many manual printers at once without calling on_printer_removed"""
+        with self._lock:
+            updated = dict(self.printers)
+            removed = []
+            for name in names:
+                printer_info = updated.get(name)
+                if printer_info and printer_info.status == "Manual":
+                    removed.append(updated.pop(name))
+            if removed:
+                self._replace_printers(updated)
+        return removed
+
+    def add_cached_printers(self, printers: List[PrinterInfo]):
+        """Add printers remembered from a previous run without callbacks
+
+        They get the "Cached" status and never replace a printer that is
+        already known.
+        """
+        with self._lock:
+            updated = dict(self.printers)
+            for printer_info in printers:
+                if printer_info.name not in updated:
+                    printer_info.status = "Cached"
+                    updated[printer_info.name] = printer_info
+            self._replace_printers(updated)
+        logger.info(f"Loaded {len(printers)} cached printers")
+
+    def revalidate_cached_printers(self, timeout: float = 2.0) -> List[PrinterInfo]:
+        """Drop cached printers not accepting connections; returns them"""
+        cached = [
+            printer_info
+            for printer_info in self.printers.values()
+            if printer_info.status == "Cached"
+        ]
+        if not cached:
+            return []
+
+        def reachable(printer_info: PrinterInfo) -> bool:
+            try:
+                with socket.create_connection(
+                    (printer_info.address, printer_info.port), timeout=timeout
+                ):
+                    return True
+            except OSError:
+                return False
+
+        with ThreadPoolExecutor(max_workers=min(16, len(cached))) as executor:
+            results = list(executor.map(reachable, cached))
+        unreachable = [p for p, ok in zip(cached, results) if not ok]
+
+        with self._lock:
+            updated = dict(self.printers)
+            removed = []
+            for printer_info in unreachable:
+                # Only if zeroconf has not found it again in the meantime
+                if updated.get(printer_info.name) is printer_info:
+                    removed.append(updated.pop(printer_info.name))
+            if removed:
+                self._replace_printers(updated)
+        if removed:
+            logger.info(f"Dropped {len(removed)} unreachable cached printers")
+        return removed
+
+    def remove_manual_printer(self, name: str) -> bool:
+        """Remove a manually added printer"""
+        with self._lock:
+            printer_info = self.printers.get(name)
+            if not printer_info or printer_info.status != "Manual":
+                return False
+            printers = dict(self.printers)
+            del printers[name]
+            self._replace_printers(printers)
+        logger.info(f"Manually removed printer: {name}")
+
+        if self.on_printer_removed:
+            self.on_printer_removed(printer_info)
+        return True
@@ -1,37 +1,338 @@
+import base64
 import logging
 import json
 import os
 import threading
-from typing import Dict, List, Optional, Any
+import time
+from bisect import bisect_left, bisect_right
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Any, Tuple
+from brother_ql.devicedependent import models
 from printer_discovery import PrinterDiscoveryService, PrinterInfo
 from printer_service import LabelPrinterService
 
 logger = logging.getLogger(__name__)
 
+# brother_ql model names by lower case name; discovery reports them in any case
+MODEL_NAMES = {model.lower(): model for model in models}
+
+# Fields of a printer in the listing, for projections
+LISTING_FIELDS = (
+    "name",
+    "address",
+    "port",
+    "model",
+    "last_seen",
+    "status",
+    "connection_string",
+    "display_name",
+    "printer_id",
+    "default_label_size",
+    "pools",
+)
+
+# Listing fields that can be filtered on, and the printer attribute each uses
+FILTER_FIELDS = {
+    "status": "status",
+    "model": "model",
+    "label_size": "default_label_size",
+    "pool": "pools",
+}
+
+VALID_LABEL_SIZES = [
+    "12",
+    "29",
+    "38",
+    "50",
+    "54",
+    "62",
+    "62red",
+    "102",
+    "17x54",
+    "17x87",
+    "23x23",
+    "29x42",
+    "29x90",
+    "38x90",
+    "39x48",
+    "52x29",
+    "62x29",
+    "62x100",
+    # Whatever media the printer reports as loaded
+    "auto",
+]
+AUTO_LABEL_SIZE = "auto"
+
+
+class RegistrySnapshot:
+    """Immutable version of the printer registry
+
+    Built by writers and swapped in as a whole, so readers can use a snapshot
+    without any locking. Nothing in a snapshot is modified after publishing.
+    """
+
+    __slots__ = (
+        "version",
+        "printers",
+        "display_names",
+        "default_label_sizes",
+        "pools",
+        "printer_ids",
+        "services",
+        "listing",
+        "sort_keys",
+        "sorted_listing",
+        "indexes",
+    )
+
+    def __init__(
+        self,
+        version: int,
+        printers: Mapping[str, PrinterInfo],
+        display_names: Dict[str, str],
+        default_label_sizes: Dict[str, str],
+        services: Dict[str, LabelPrinterService],
+        pools: Optional[Dict[str, Tuple[str, ...]]] = None,
+    ):
+        self.version = version
+        self.printers = printers  # printer_id -> PrinterInfo
+        self.display_names = MappingProxyType(display_names)  # printer_id -> name
+        self.default_label_sizes = MappingProxyType(
+            default_label_sizes
+        )  # printer_id -> label_size
+        self.services = MappingProxyType(services)  # display_name -> service
+        self.pools = MappingProxyType(pools or {})  # printer_id -> pool names
+
+        # display_name -> printer_id, for available printers only
+        self.printer_ids = MappingProxyType(
+            {display_names.get(pid, pid): pid for pid in printers}
+        )
+
+        listing = []
+        for printer_id, printer_info in printers.items():
+            printer_data = printer_info.to_dict()
+            printer_data["display_name"] = display_names.get(printer_id, printer_id)
+            printer_data["printer_id"] = printer_id
+            printer_data["default_label_size"] = default_label_sizes.get(
+                printer_id, "62"
+            )
+            printer_data["pools"] = list(self.pools.get(printer_id, ()))
+            listing.append(printer_data)
+        self.listing = tuple(listing)
+
+        # Listing ordered by (display_name, printer_id) for cursor pagination,
+        # plus an index per filter field: value -> (sorted ranks, rank set)
+        sorted_listing = sorted(
+            listing, key=lambda p: (p["display_name"], p["printer_id"])
+        )
+        self.sorted_listing = tuple(sorted_listing)
+        self.sort_keys = tuple(
+            (p["display_name"], p["printer_id"]) for p in sorted_listing
+        )
+        indexes = {}
+        for field, attribute in FILTER_FIELDS.items():
+            ranks: Dict[str, List[int]] = {}
+            for rank, printer_data in enumerate(sorted_listing):
+                values = printer_data[attribute]
+                for value in values if isinstance(values, list) else [values]:
+                    ranks.setdefault(value, []).append(rank)
+            indexes[field] = {
+                value: (tuple(value_ranks), frozenset(value_ranks))
+                for value, value_ranks in ranks.items()
+            }
+        self.indexes = indexes
+
+    def query(
+        self,
+        filters: Optional[Dict[str, str]] = None,
+        name_prefix: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Filter, paginate and project the printer listing using the indexes
+
+        Only printers that match are touched, so the cost depends on the
+        size of the page and the most selective filter, not on the fleet.
+
+        Args:
+            filters: Field (see FILTER_FIELDS) -> required value
+            name_prefix: Only printers whose display name starts with this
+            cursor: next_cursor of the previous page
+            limit: Maximum number of printers to return
+            fields: Only include these fields of each printer
+
+        Returns:
+            Tuple of the printers and the cursor of the next page (or None)
+        """
+        keys = self.sort_keys
+        lo, hi = 0, len(keys)
+        if name_prefix:
+            lo = bisect_left(keys, (name_prefix,))
+            hi = bisect_left(keys, (name_prefix + "\U0010ffff",))
+        if cursor:
+            lo = max(lo, bisect_right(keys, decode_cursor(cursor)))
+
+        candidates = []
+        for field, value in (filters or {}).items():
+            candidates.append(self.indexes[field].get(value, ((), frozenset())))
+
+        if candidates:
+            candidates.sort(key=lambda c: len(c[0]))
+            ranks, _ = candidates[0]
+            others = [rank_set for _, rank_set in candidates[1:]]
+            start = bisect_left(ranks, lo)
+            end = bisect_left(ranks, hi)
+            matches = (
+                rank
+                for rank in ranks[start:end]
+                if all(rank in rank_set for rank_set in others)
+            )
+        else:
+            matches = iter(range(lo, hi))
+
+        page = []
+        next_cursor = None
+        for rank in matches:
+            if limit is not None and len(page) == limit:
+                next_cursor = encode_cursor(keys[page[-1]])
+                break
+            page.append(rank)
+
+        printers = []
+        for rank in page:
+            printer_data = self.sorted_listing[rank]
+            if fields:
+                printer_data = {
+                    field: printer_data[field]
+                    for field in fields
+                    if field in printer_data
+                }
+            printers.append(printer_data)
+        return printers, next_cursor
+
+
+def encode_cursor(key: Tuple[str, str]) -> str:
+    """Encode a listing sort key as an opaque pagination cursor"""
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """Decode a pagination cursor; raises ValueError for invalid cursors"""
+    try:
+        display_name, printer_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return (str(display_name), str(printer_id))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
 
 class PrinterManager:
+    # Cached printers not seen for longer than this are not loaded at startup
+    CACHED_PRINTER_MAX_AGE = 7 * 24 * 3600
+    # Seconds between saves of the discovered printers, so last_seen stays
+    # current for printers that remain online even if the server crashes
+    DISCOVERED_SAVE_INTERVAL = 600
+
     def __init__(self, backend_class: Any):
         self.backend_class = backend_class
         self.printer_configs_file = "printer_configs.json"
-        self.printer_display_names: Dict[str, str] = {}  # printer_id -> display_name
-        self.printer_default_label_sizes: Dict[str, str] = (
-            {}
-        )  # printer_id -> label_size
-        self.printer_services: Dict[str, LabelPrinterService] = (
-            {}
-        )  # display_name -> service
+        self.discovered_printers_file = "discovered_printers.json"
         self.discovery_service = PrinterDiscoveryService(
             on_printer_found=self._on_printer_found,
             on_printer_removed=self._on_printer_removed,
         )
+        self._snapshot = RegistrySnapshot(0, MappingProxyType({}), {}, {}, {})
+        # Serializes writers only; readers use self._snapshot without locking
         self._lock = threading.Lock()
+        # Serializes writes of the configuration file
+        self._save_lock = threading.Lock()
+        self._saved_version = -1
+        # Called with the saved configuration, e.g. to share it with a cluster
+        self.on_config_saved: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._stopped = threading.Event()
 
         # Load saved configurations
         self._load_printer_configs()
+        # Printers discovered in previous runs are usable right away
+        self._load_discovered_printers()
+
+    @property
+    def snapshot(self) -> RegistrySnapshot:
+        """The current registry snapshot"""
+        return self._snapshot
+
+    @property
+    def printer_display_names(self) -> Mapping[str, str]:
+        return self._snapshot.display_names
+
+    @property
+    def printer_default_label_sizes(self) -> Mapping[str, str]:
+        return self._snapshot.default_label_sizes
+
+    @property
+    def printer_services(self) -> Mapping[str, LabelPrinterService]:
+        return self._snapshot.services
 
     def start_discovery(self):
         """Start the printer discovery service"""
         self.discovery_service.start_discovery()
+        if any(p.status == "Cached" for p in self._snapshot.printers.values()):
+            threading.Thread(
+                target=self._revalidate_cached_printers,
+                name="revalidate-cached-printers",
+                daemon=True,
+            ).start()
+        threading.Thread(
+            target=self._save_discovered_periodically,
+            name="save-discovered-printers",
+            daemon=True,
+        ).start()
+
+    def _publish(
+        self,
+        display_names: Optional[Dict[str, str]] = None,
+        default_label_sizes: Optional[Dict[str, str]] = None,
+        pools: Optional[Dict[str, Tuple[str, ...]]] = None,
+    ) -> RegistrySnapshot:
+        """Build and swap in a new snapshot (lock must be held)"""
+        current = self._snapshot
+        printers = self.discovery_service.get_printers()
+        if display_names is None:
+            display_names = dict(current.display_names)
+        if default_label_sizes is None:
+            default_label_sizes = dict(current.default_label_sizes)
+        if pools is None:
+            pools = dict(current.pools)
+
+        # Services are cheap, but keep existing ones for unchanged printers
+        services = {}
+        for printer_id, printer_info in printers.items():
+            display_name = display_names.get(printer_id, printer_id)
+            printer_address = f"tcp://{printer_info.address}:{printer_info.port}"
+            service = current.services.get(display_name)
+            if (
+                not service
+                or service.printer_address != printer_address
+                or service.model != printer_info.model
+            ):
+                service = LabelPrinterService(
+                    printer_info.model,
+                    printer_address,
+                    self.backend_class,
+                )
+            services[display_name] = service
+
+        snapshot = RegistrySnapshot(
+            current.version + 1,
+            printers,
+            display_names,
+            default_label_sizes,
+            services,
+            pools,
+        )
+        self._snapshot = snapshot
+        return snapshot
 
     def _load_printer_configs(self):
         """Load printer configurations from file"""
@@ -39,20 +340,9 @@ class PrinterManager:
             if os.path.exists(self.printer_configs_file):
                 with open(self.printer_configs_file, "r", encoding="utf-8") as f:
                     data = json.load(f)
-                    self.printer_display_names = data.get("display_names", {})
-                    self.printer_default_label_sizes = data.get(
-                        "default_label_sizes", {}
-                    )
 
-                    # Load manual printers
-                    manual_printers = data.get("manual_printers", {})
-                    for printer_id, printer_info in manual_printers.items():
-                        self.discovery_service.add_manual_printer(
-                            printer_id,
-                            printer_info["address"],
-                            printer_info.get("port", 9100),
-                            printer_info.get("model", "QL-500"),
-                        )
+                self._apply_config(data)
+                self._saved_version = self._snapshot.version
 
                 logger.info(
                     f"Loaded {len(self.printer_display_names)} printer configurations"
@@ -60,52 +350,185 @@ class PrinterManager:
         except Exception as e:
             logger.error(f"Failed to load printer configurations: {e}")
 
-    def _save_printer_configs(self):
-        """Save printer configurations to file"""
+    def _apply_config(self, data: Dict[str, Any]) -> RegistrySnapshot:
+        """Replace the configured printers and settings with a saved configuration"""
+        # Load manual printers
+        manual_printers = data.get("manual_printers", {})
+        with self._lock:
+            stale = [
+                printer_id
+                for printer_id, printer_info in self._snapshot.printers.items()
+                if printer_info.status == "Manual" and printer_id not in manual_printers
+            ]
+            self.discovery_service.remove_manual_printers(stale)
+            self.discovery_service.add_manual_printers(
+                [
+                    PrinterInfo(
+                        printer_id,
+                        printer_info["address"],
+                        printer_info.get("port", 9100),
+                        printer_info.get("model", "QL-500"),
+                    )
+                    for printer_id, printer_info in manual_printers.items()
+                ]
+            )
+
+            return self._publish(
+                data.get("display_names", {}),
+                data.get("default_label_sizes", {}),
+                {
+                    printer_id: tuple(pools)
+                    for printer_id, pools in data.get("pools", {}).items()
+                },
+            )
+
+    def apply_shared_config(self, data: Dict[str, Any]):
+        """Apply a configuration saved by another node and persist it locally"""
+        snapshot = self._apply_config(data)
+        self._save_printer_configs(snapshot, notify=False)
+
+    def _load_discovered_printers(self):
+        """Load the printers discovered in previous runs as cached printers"""
         try:
-            # Get manual printers
-            manual_printers = {}
-            for (
-                printer_id,
-                printer_info,
-            ) in self.discovery_service.get_printers().items():
-                if printer_info.status == "Manual":  # Mark manual printers
-                    manual_printers[printer_id] = {
-                        "address": printer_info.address,
-                        "port": printer_info.port,
-                        "model": printer_info.model,
-                    }
+            if not os.path.exists(self.discovered_printers_file):
+                return
+            with open(self.discovered_printers_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+
+            oldest = time.time() - self.CACHED_PRINTER_MAX_AGE
+            printers = []
+            for printer_id, printer_data in data.get("printers", {}).items():
+                if printer_data.get("last_seen", 0) < oldest:
+                    continue
+                printer_info = PrinterInfo(
+                    printer_id,
+                    printer_data["address"],
+                    printer_data["port"],
+                    printer_data.get("model", "Unknown"),
+                )
+                printer_info.last_seen = printer_data.get("last_seen", 0)
+                printers.append(printer_info)
 
-            data = {
-                "display_names": self.printer_display_names,
-                "default_label_sizes": self.printer_default_label_sizes,
-                "manual_printers": manual_printers,
+            if printers:
+                with self._lock:
+                    self.discovery_service.add_cached_printers(printers)
+                    self._publish()
+        except Exception as e:
+            logger.error(f"Failed to load discovered printers: {e}")
+
+    def _save_discovered_printers(self):
+        """Save the discovered printers for the next start"""
+        # Printers zeroconf lists are online (it removes those that leave);
+        # cached ones keep the time they were last seen
+        now = time.time()
+        printers = {
+            printer_id: {
+                "address": printer_info.address,
+                "port": printer_info.port,
+                "model": printer_info.model,
+                "last_seen": (
+                    printer_info.last_seen if printer_info.status == "Cached" else now
+                ),
             }
+            for printer_id, printer_info in self._snapshot.printers.items()
+            if printer_info.status != "Manual"
+        }
+        try:
+            with self._save_lock:
+                temp_file = f"{self.discovered_printers_file}.tmp"
+                with open(temp_file, "w", encoding="utf-8") as f:
+                    json.dump({"printers": printers}, f, indent=2)
+                os.replace(temp_file, self.discovered_printers_file)
+        except Exception as e:
+            logger.error(f"Failed to save discovered printers: {e}")
+
+    def _save_discovered_periodically(self):
+        while not self._stopped.wait(self.DISCOVERED_SAVE_INTERVAL):
+            self._save_discovered_printers()
+
+    def _revalidate_cached_printers(self):
+        """Drop cached printers that are no longer reachable"""
+        try:
+            removed = self.discovery_service.revalidate_cached_printers()
+            if removed:
+                with self._lock:
+                    self._publish()
+                self._save_discovered_printers()
+        except Exception as e:
+            logger.error(f"Failed to revalidate cached printers: {e}")
 
-            with open(self.printer_configs_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2)
+    def _save_printer_configs(
+        self, snapshot: Optional[RegistrySnapshot] = None, notify: bool = True
+    ):
+        """Save printer configurations to file"""
+        snapshot = snapshot or self._snapshot
+        try:
+            with self._save_lock:
+                # A newer snapshot has already been written
+                if snapshot.version <= self._saved_version:
+                    return
+
+                # Get manual printers
+                manual_printers = {}
+                for printer_id, printer_info in snapshot.printers.items():
+                    if printer_info.status == "Manual":  # Mark manual printers
+                        manual_printers[printer_id] = {
+                            "address": printer_info.address,
+                            "port": printer_info.port,
+                            "model": printer_info.model,
+                        }
+
+                data = {
+                    "display_names": dict(snapshot.display_names),
+                    "default_label_sizes": dict(snapshot.default_label_sizes),
+                    "pools": {
+                        printer_id: list(pools)
+                        for printer_id, pools in snapshot.pools.items()
+                    },
+                    "manual_printers": manual_printers,
+                }
+
+                with open(self.printer_configs_file, "w", encoding="utf-8") as f:
+                    json.dump(data, f, indent=2)
+                self._saved_version = snapshot.version
 
             logger.info("Printer configurations saved")
+            if notify and self.on_config_saved:
+                self.on_config_saved(data)
         except Exception as e:
             logger.error(f"Failed to save printer configurations: {e}")
 
     def _on_printer_found(self, printer_info: PrinterInfo):
         """Called when a new printer is discovered"""
         try:
+            printer_id = printer_info.name
             with self._lock:
-                printer_id = printer_info.name
+                current = self._snapshot
+                # Only new or moved printers need the discovered printers saved
+                previous = current.printers.get(printer_id)
+                moved = not previous or (
+                    previous.address,
+                    previous.port,
+                    previous.model,
+                ) != (printer_info.address, printer_info.port, printer_info.model)
+                display_names = dict(current.display_names)
+                default_label_sizes = dict(current.default_label_sizes)
 
                 # Set default display name if not already set
-                if printer_id not in self.printer_display_names:
-                    self.printer_display_names[printer_id] = printer_info.name
+                if printer_id not in display_names:
+                    display_names[printer_id] = printer_info.name
 
                 # Set default label size if not already set
-                if printer_id not in self.printer_default_label_sizes:
-                    self.printer_default_label_sizes[printer_id] = (
-                        "62"  # Default to 62mm
-                    )
+                needs_save = printer_id not in default_label_sizes
+                if needs_save:
+                    default_label_sizes[printer_id] = "62"  # Default to 62mm
+
+                snapshot = self._publish(display_names, default_label_sizes)
 
-                    self._save_printer_configs()
+            if needs_save:
+                self._save_printer_configs(snapshot)
+            if moved and printer_info.status != "Manual":
+                self._save_discovered_printers()
         except Exception as e:
             logger.error(f"Error in _on_printer_found: {e}")
 
@@ -113,109 +536,72 @@ class PrinterManager:
         """Called when a printer is removed"""
         try:
             with self._lock:
-                printer_id = printer_info.name
-                display_name = self.printer_display_names.get(printer_id)
-
-                # Remove printer service if it exists
-                if display_name and display_name in self.printer_services:
-                    del self.printer_services[display_name]
+                # The printer service is dropped with the printer
+                self._publish()
+            if printer_info.status != "Manual":
+                self._save_discovered_printers()
         except Exception as e:
             logger.error(f"Error in _on_printer_removed: {e}")
 
     def get_printer_service(self, display_name: str) -> Optional[LabelPrinterService]:
-        """Get or create a printer service for the given display name"""
-        with self._lock:
-            if display_name in self.printer_services:
-                return self.printer_services[display_name]
-
-            # Find printer by display name
-            printer_id = None
-            for pid, dname in self.printer_display_names.items():
-                if dname == display_name:
-                    printer_id = pid
-                    break
-
-            if not printer_id:
-                return None
+        """Get the printer service for the given display name"""
+        return self._snapshot.services.get(display_name)
 
-            printer_info = self.discovery_service.get_printer(printer_id)
-            if not printer_info:
-                return None
-
-            # Create and cache the service
-            printer_address = f"tcp://{printer_info.address}:{printer_info.port}"
-            service = LabelPrinterService(
-                printer_info.model,
-                printer_address,
-                self.backend_class,
-            )
-            self.printer_services[display_name] = service
-
-            return service
+    def get_printer_id(self, display_name: str) -> Optional[str]:
+        """Get the printer ID of an available printer by display name"""
+        return self._snapshot.printer_ids.get(display_name)
 
     def get_default_label_size(self, printer_id: str) -> str:
         """Get the default label size for a printer"""
-        with self._lock:
-            return self.printer_default_label_sizes.get(printer_id, "62")
+        return self._snapshot.default_label_sizes.get(printer_id, "62")
 
     def set_default_label_size(self, printer_id: str, label_size: str) -> bool:
         """Set the default label size for a printer"""
         with self._lock:
-            if printer_id not in self.discovery_service.get_printers():
+            current = self._snapshot
+            if printer_id not in current.printers:
                 return False
 
-            self.printer_default_label_sizes[printer_id] = label_size
-            self._save_printer_configs()
-            return True
+            default_label_sizes = dict(current.default_label_sizes)
+            default_label_sizes[printer_id] = label_size
+            snapshot = self._publish(default_label_sizes=default_label_sizes)
+
+        self._save_printer_configs(snapshot)
+        return True
 
     def list_printers(self) -> List[Dict[str, Any]]:
         """List all available printers with their display names and status"""
-        print("Listing printers")
-        # Get printers from discovery service (this has its own lock)
-        discovered_printers = self.discovery_service.get_printers()
-        print(f"Discovered printers: {discovered_printers}")
-
-        # Only lock for the display names access
-        with self._lock:
-            print("Listing printers 2")
-            display_names_copy = self.printer_display_names.copy()
-            label_sizes_copy = self.printer_default_label_sizes.copy()
+        return list(self._snapshot.listing)
 
-        printers = []
-        for printer_id, printer_info in discovered_printers.items():
-            display_name = display_names_copy.get(printer_id, printer_id)
-            default_label_size = label_sizes_copy.get(printer_id, "62")
-
-            printer_data = printer_info.to_dict()
-            printer_data["display_name"] = display_name
-            printer_data["printer_id"] = printer_id
-            printer_data["default_label_size"] = default_label_size
-
-            printers.append(printer_data)
-
-        return printers
+    def query_printers(
+        self,
+        filters: Optional[Dict[str, str]] = None,
+        name_prefix: Optional[str] = None,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Filtered, paginated and projected printer listing (see RegistrySnapshot.query)"""
+        return self._snapshot.query(filters, name_prefix, cursor, limit, fields)
 
     def set_display_name(self, printer_id: str, display_name: str) -> bool:
         """Set display name for a printer"""
         with self._lock:
-            if printer_id not in self.discovery_service.get_printers():
+            current = self._snapshot
+            if printer_id not in current.printers:
                 return False
 
             # Check if display name is already used
-            for pid, dname in self.printer_display_names.items():
+            for pid, dname in current.display_names.items():
                 if dname == display_name and pid != printer_id:
                     return False  # Display name already in use
 
-            old_display_name = self.printer_display_names.get(printer_id)
-            self.printer_display_names[printer_id] = display_name
-
-            # Update printer service cache
-            if old_display_name and old_display_name in self.printer_services:
-                service = self.printer_services.pop(old_display_name)
-                self.printer_services[display_name] = service
+            display_names = dict(current.display_names)
+            display_names[printer_id] = display_name
+            snapshot = self._publish(display_names)
 
-            self._save_printer_configs()
-            return True
+        self._save_printer_configs(snapshot)
+        return True
 
     def add_manual_printer(
         self,
@@ -228,21 +614,24 @@ class PrinterManager:
     ) -> bool:
         """Manually add a printer"""
         try:
+            # Publishes the printer through _on_printer_found
             self.discovery_service.add_manual_printer(printer_id, address, port, model)
 
-            # Mark as manual
-            if printer_id in self.discovery_service.printers:
-                self.discovery_service.printers[printer_id].status = "Manual"
+            with self._lock:
+                current = self._snapshot
+                display_names = dict(current.display_names)
+                if display_name:
+                    display_names[printer_id] = display_name
+                elif printer_id not in display_names:
+                    display_names[printer_id] = printer_id
 
-            if display_name:
-                self.printer_display_names[printer_id] = display_name
-            elif printer_id not in self.printer_display_names:
-                self.printer_display_names[printer_id] = printer_id
+                # Set default label size
+                default_label_sizes = dict(current.default_label_sizes)
+                default_label_sizes[printer_id] = default_label_size
 
-            # Set default label size
-            self.printer_default_label_sizes[printer_id] = default_label_size
+                snapshot = self._publish(display_names, default_label_sizes)
 
-            self._save_printer_configs()
+            self._save_printer_configs(snapshot)
             return True
         except Exception as e:
             logger.error(f"Failed to add manual printer: {e}")
@@ -250,43 +639,230 @@ class PrinterManager:
 
     def remove_printer(self, printer_id: str) -> bool:
         """Remove a manually added printer"""
+        # Can only remove manual printers
+        if not self.discovery_service.remove_manual_printer(printer_id):
+            return False
+
         with self._lock:
-            if printer_id not in self.discovery_service.get_printers():
-                return False
+            current = self._snapshot
+
+            # Remove display name and default label size
+            display_names = dict(current.display_names)
+            display_names.pop(printer_id, None)
+            default_label_sizes = dict(current.default_label_sizes)
+            default_label_sizes.pop(printer_id, None)
+            pools = dict(current.pools)
+            pools.pop(printer_id, None)
+
+            snapshot = self._publish(display_names, default_label_sizes, pools)
+
+        self._save_printer_configs(snapshot)
+        return True
+
+    def import_printers(
+        self, definitions: List[Dict[str, Any]], replace: bool = False
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        Add or update many manual printers in one transaction
+
+        All definitions are validated first; if any is invalid nothing is
+        changed. Otherwise the registry is updated once and the configuration
+        file is written once.
+
+        Args:
+            definitions: Printer definitions with printer_id, address and
+                optionally port, model, display_name, default_label_size, pools
+            replace: Remove manual printers that are not part of the import
+
+        Returns:
+            Tuple of the number of imported printers and a list of
+            validation errors ({"index", "printer_id", "error"})
+        """
+        with self._lock:
+            current = self._snapshot
+            printers, seen_ids, errors = self._validate_import(
+                current, definitions, replace
+            )
+            if errors:
+                return 0, errors
+
+            removed_ids = []
+            if replace:
+                removed_ids = [
+                    printer_id
+                    for printer_id, printer_info in current.printers.items()
+                    if printer_info.status == "Manual" and printer_id not in seen_ids
+                ]
+                self.discovery_service.remove_manual_printers(removed_ids)
+            self.discovery_service.add_manual_printers(
+                [printer_info for printer_info, _, _, _ in printers]
+            )
+
+            display_names = dict(current.display_names)
+            default_label_sizes = dict(current.default_label_sizes)
+            pools = dict(current.pools)
+            for printer_id in removed_ids:
+                display_names.pop(printer_id, None)
+                default_label_sizes.pop(printer_id, None)
+                pools.pop(printer_id, None)
+            for printer_info, display_name, label_size, printer_pools in printers:
+                display_names[printer_info.name] = display_name
+                default_label_sizes[printer_info.name] = label_size
+                if printer_pools:
+                    pools[printer_info.name] = printer_pools
+                else:
+                    pools.pop(printer_info.name, None)
+
+            snapshot = self._publish(display_names, default_label_sizes, pools)
+
+        self._save_printer_configs(snapshot)
+        logger.info(f"Imported {len(printers)} printers (removed {len(removed_ids)})")
+        return len(printers), []
+
+    def _validate_import(
+        self,
+        current: RegistrySnapshot,
+        definitions: List[Dict[str, Any]],
+        replace: bool,
+    ) -> Tuple[List[Tuple[PrinterInfo, str, str, Tuple[str, ...]]], set, list]:
+        """Validate import definitions against the registry (lock must be held)"""
+        errors = []
+        printers = []
+        seen_ids = set()
+        seen_names = {}
 
-            printer_info = self.discovery_service.get_printer(printer_id)
-            if printer_info and printer_info.status != "Manual":
-                return False  # Can only remove manual printers
+        for index, definition in enumerate(definitions):
+            if not isinstance(definition, dict):
+                definition = {}
+            printer_id = definition.get("printer_id")
 
-            # Remove from discovery service
-            if printer_id in self.discovery_service.printers:
-                del self.discovery_service.printers[printer_id]
+            def fail(message):
+                errors.append(
+                    {"index": index, "printer_id": printer_id, "error": message}
+                )
 
-            # Remove display name and default label size
-            display_name = self.printer_display_names.pop(printer_id, None)
-            self.printer_default_label_sizes.pop(printer_id, None)
+            if not isinstance(printer_id, str) or not printer_id:
+                fail("printer_id is required")
+                continue
+            if printer_id in seen_ids:
+                fail("Duplicate printer_id")
+                continue
+            seen_ids.add(printer_id)
+
+            address = definition.get("address")
+            port = definition.get("port", 9100)
+            model = definition.get("model", "QL-500")
+            if isinstance(model, str):
+                model = MODEL_NAMES.get(model.lower(), model)
+            display_name = definition.get("display_name")
+            if display_name is None:
+                display_name = current.display_names.get(printer_id, printer_id)
+            label_size = definition.get("default_label_size", "62")
+            pools = definition.get("pools", [])
+
+            if not isinstance(address, str) or not address:
+                fail("address is required")
+            elif (
+                not isinstance(port, int)
+                or isinstance(port, bool)
+                or not 0 < port < 65536
+            ):
+                fail("port must be an integer between 1 and 65535")
+            elif model not in models:
+                fail(f"Unknown model '{model}'")
+            elif label_size not in VALID_LABEL_SIZES:
+                fail(f"Invalid label size '{label_size}'")
+            elif not isinstance(pools, list) or not all(
+                isinstance(pool, str) for pool in pools
+            ):
+                fail("pools must be a list of strings")
+            elif not isinstance(display_name, str) or not display_name:
+                fail("display_name must be a non-empty string")
+            elif display_name in seen_names:
+                fail(f"Display name '{display_name}' is used more than once")
+            else:
+                seen_names[display_name] = printer_id
+                printers.append(
+                    (
+                        PrinterInfo(printer_id, address, port, model),
+                        display_name,
+                        label_size,
+                        tuple(pools),
+                    )
+                )
 
-            # Remove service
-            if display_name and display_name in self.printer_services:
-                del self.printer_services[display_name]
+        # Display names must stay unique across the printers kept as well
+        kept_ids = {
+            printer_id
+            for printer_id, printer_info in current.printers.items()
+            if printer_id not in seen_ids
+            and not (replace and printer_info.status == "Manual")
+        }
+        for printer_id in kept_ids:
+            display_name = current.display_names.get(printer_id, printer_id)
+            if display_name in seen_names:
+                errors.append(
+                    {
+                        "index": None,
+                        "printer_id": seen_names[display_name],
+                        "error": f"Display name '{display_name}' is already used by '{printer_id}'",
+                    }
+                )
 
-            self._save_printer_configs()
-            return True
+        return printers, seen_ids, errors
+
+    def export_printers(
+        self, manual_only: bool = True
+    ) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """
+        Export printer definitions in the format accepted by import_printers
+
+        Discovered printers whose model is not known to brother_ql (such as
+        the generic "Brother QL") cannot be imported and are left out.
+
+        Returns:
+            Tuple of the definitions and the IDs of the printers left out
+        """
+        snapshot = self._snapshot
+        definitions = []
+        skipped = []
+        for printer_id, printer_info in snapshot.printers.items():
+            if manual_only and printer_info.status != "Manual":
+                continue
+            model = MODEL_NAMES.get(printer_info.model.lower())
+            if model is None:
+                skipped.append(printer_id)
+                continue
+            definitions.append(
+                {
+                    "printer_id": printer_id,
+                    "address": printer_info.address,
+                    "port": printer_info.port,
+                    "model": model,
+                    "display_name": snapshot.display_names.get(printer_id, printer_id),
+                    "default_label_size": snapshot.default_label_sizes.get(
+                        printer_id, "62"
+                    ),
+                    "pools": list(snapshot.pools.get(printer_id, ())),
+                }
+            )
+        return definitions, skipped
 
     def get_default_printer(self) -> Optional[str]:
         """Get the default printer display name"""
-        printers = self.list_printers()
-        if not printers:
+        snapshot = self._snapshot
+        if not snapshot.listing:
             return None
 
         # Return the first printer, or the one marked as default
-        for printer in printers:
-            if printer["display_name"] == "Default Printer":
-                return printer["display_name"]
+        if "Default Printer" in snapshot.printer_ids:
+            return "Default Printer"
 
-        return printers[0]["display_name"]
+        return snapshot.listing[0]["display_name"]
 
     def shutdown(self):
         """Shutdown the printer manager"""
+        self._stopped.set()
         self.discovery_service.stop_discovery()
         self._save_printer_configs()
+        self._save_discovered_printers()
@@ -1,96 +1,554 @@
 import time
 import logging
+import struct
 from io import BytesIO
-from typing import Dict, Any
+from typing import Dict, Any, Iterable, Optional, Union
 from PIL import Image
 
-from brother_ql.devicedependent import label_type_specs, ENDLESS_LABEL
-from brother_ql import BrotherQLRaster, create_label
+from brother_ql.devicedependent import (
+    label_type_specs,
+    ENDLESS_LABEL,
+    DIE_CUT_LABEL,
+    ROUND_DIE_CUT_LABEL,
+    right_margin_addition,
+    two_color_support,
+)
+from brother_ql import BrotherQLRaster, BrotherQLUnsupportedCmd, create_label
+from brother_ql.reader import chunker, interpret_response
+import packbits
 
 logger = logging.getLogger(__name__)
 
+# Lookup table flipping every bit of a byte; PIL's 1-bit images store white
+# as 1 while the printer expects 1 for a black dot.
+_INVERT_BITS = bytes(255 - i for i in range(256))
+
+# Cut modes for multi-copy jobs: after every label or once after the last one
+CUT_MODES = ("each", "end")
+
+# Most labels a print job cut only at its end may have; the printer's cut
+# every n labels setting (ESC i A) goes up to 255
+MAX_CUT_AT_END_LABELS = 255
+
+# Invalidate, initialize and request the 32 byte status block
+STATUS_REQUEST = b"\x00" * 200 + b"\x1b\x40" + b"\x1b\x69\x53"
+STATUS_LENGTH = 32
+# Seconds to wait for the reply to a status request
+STATUS_REPLY_TIMEOUT = 0.5
+# Seconds to wait for the next status message while a job prints
+PRINT_STATUS_TIMEOUT = 10.0
+
+
+def parse_status(data: bytes) -> Dict[str, Any]:
+    """
+    Interpret a status block and find the label size of the loaded media
+
+    Raises:
+        ValueError: If the data is not a status block
+    """
+    try:
+        status = interpret_response(data)
+    except NameError as e:  # brother_ql reports malformed data this way
+        raise ValueError(str(e))
+    status["label_size"] = media_label_size(
+        status["media_width"], status["media_length"]
+    )
+    return status
+
+
+def count_pages(raster_data: bytes) -> int:
+    """The number of pages (print commands) in raster instructions"""
+    return sum(
+        1
+        for instruction in chunker(raster_data)
+        if instruction[:1] in (b"\x0c", b"\x1a")
+    )
+
+
+def media_label_size(width: int, length: int) -> Optional[str]:
+    """The label size of media width x length mm (length 0: endless)"""
+    for label_size, specs in label_type_specs.items():
+        # Two-color rolls report the same size; they have to be asked for
+        if "red" not in label_size and media_fits(label_size, width, length):
+            return label_size
+    return None
+
+
+def media_fits(label_size: str, width: int, length: int) -> bool:
+    """Whether labels of label_size are width x length mm media"""
+    specs = label_type_specs.get(label_size)
+    if not specs:
+        return False
+    tape_width, tape_length = specs["tape_size"]
+    if specs["kind"] == ENDLESS_LABEL:
+        return width == tape_width and length == 0
+    return (width, length) == (tape_width, tape_length)
+
 
 class LabelPrinterService:
     def __init__(self, model: str, printer_address: str, backend_class: Any):
         self.model = model
         self.printer_address = printer_address
         self.backend_class = backend_class
+        # Cleared when the printer does not answer the status request of a
+        # job, so later jobs do not wait for it; set again by read_status()
+        self.answers_status = True
+        # Cleared when the printer does not report the end of a job, so later
+        # jobs only read the reply to their status request
+        self.reports_progress = True
 
-    def decode_base64_image(self, base64_string: str) -> Image.Image:
-        """Decode a base64 string into a PIL Image"""
-        import base64
-
+    def decode_image(self, image_data: bytes) -> Image.Image:
+        """Decode image file data (PNG, JPEG, ...) into a PIL Image"""
         try:
-            # Remove data URL prefix if present
-            if "," in base64_string:
-                base64_string = base64_string.split(",", 1)[1]
-
-            # Decode base64 to bytes
-            image_data = base64.b64decode(base64_string)
-
             # Create PIL Image from bytes
             image = Image.open(BytesIO(image_data))
 
-            # Convert to RGB if necessary
-            if image.mode not in ("L", "RGB"):
+            # Convert to RGB if necessary (1-bit images are kept for the
+            # pre-rasterized fast path)
+            if image.mode not in ("1", "L", "RGB"):
                 image = image.convert("RGB")
 
             return image
         except Exception as e:
-            logger.error(f"Failed to decode base64 image: {e}")
+            logger.error(f"Failed to decode image: {e}")
             raise
 
-    def print_label(
+    def decode_base64_raster(self, base64_string: str) -> bytes:
+        """
+        Decode a base64 string (optionally a data URL) into raw bytes
+
+        Raises:
+            ValueError: If the string is not valid base64
+        """
+        import base64
+
+        # Remove data URL prefix if present
+        if "," in base64_string:
+            base64_string = base64_string.split(",", 1)[1]
+
+        return base64.b64decode(base64_string)
+
+    def check_label_width(self, label_size: str):
+        """
+        Check that labels of label_size fit the print head of this model
+
+        Raises:
+            ValueError: If the printable width is wider than the print head
+        """
+        label_specs = label_type_specs.get(label_size)
+        if not label_specs:
+            raise ValueError(f"Unknown label size '{label_size}'")
+        width = label_specs["dots_printable"][0]
+        device_pixel_width = BrotherQLRaster(self.model).get_pixel_width()
+        if width > device_pixel_width:
+            # Same message as brother_ql's rasterizer
+            raise ValueError(
+                f"Wrong pixel width: {width}, expected {device_pixel_width}"
+            )
+
+    def is_prerasterized(self, image: Image.Image, label_size: str) -> bool:
+        """Check whether an image is already a 1-bit bitmap of the printable size"""
+        label_specs = label_type_specs.get(label_size)
+        if not label_specs or "red" in label_size or image.mode != "1":
+            return False
+        if image.size[0] > BrotherQLRaster(self.model).get_pixel_width():
+            return False
+
+        dots_printable = label_specs["dots_printable"]
+        if label_specs["kind"] == ENDLESS_LABEL:
+            return image.size[0] == dots_printable[0]
+        return image.size == tuple(dots_printable)
+
+    def render_prerasterized(
+        self, image: Image.Image, label_size: str, cut: bool = True
+    ) -> bytes:
+        """
+        Build printer instructions for a 1-bit image of the exact printable size
+
+        The image is only padded to the print head width and packed into
+        raster rows; no colour conversion, thresholding or resizing happens.
+
+        Args:
+            image: 1-bit PIL image (see is_prerasterized)
+            label_size: Size of label to print
+            cut: Whether to cut after the label
+
+        Returns:
+            bytes: Raster instructions ready to be sent to the printer
+        """
+        self.check_label_width(label_size)
+        if not self.is_prerasterized(image, label_size):
+            raise ValueError(
+                f"Image {image.size} ({image.mode}) is not a pre-rasterized "
+                f"bitmap for label size '{label_size}'"
+            )
+
+        label_specs = label_type_specs[label_size]
+        qlr = BrotherQLRaster(self.model)
+        device_pixel_width = qlr.get_pixel_width()
+        right_margin_dots = label_specs["right_margin_dots"]
+        right_margin_dots += right_margin_addition.get(self.model, 0)
+
+        if image.size[0] < device_pixel_width:
+            padded = Image.new("1", (device_pixel_width, image.size[1]), 1)
+            padded.paste(
+                image, (device_pixel_width - image.size[0] - right_margin_dots, 0)
+            )
+            image = padded
+
+        # The print head addresses dots right to left
+        image = image.transpose(Image.FLIP_LEFT_RIGHT)
+        bitmap = image.tobytes().translate(_INVERT_BITS)
+        row_len = device_pixel_width // 8
+        rows = BytesIO()
+        for start in range(0, len(bitmap), row_len):
+            rows.write(b"\x67\x00")
+            rows.write(bytes([row_len]))
+            rows.write(bitmap[start : start + row_len])
+
+        self._add_page_header(qlr, label_specs, image.size[1], cut)
+        qlr.data += rows.getvalue()
+        qlr.add_print()
+        return qlr.data
+
+    def _add_page_header(
+        self, qlr: BrotherQLRaster, label_specs: Dict[str, Any], rows: int, cut: bool
+    ):
+        """Append the preamble and per-page settings mirroring brother_ql's convert()"""
+        try:
+            qlr.add_switch_mode()
+        except BrotherQLUnsupportedCmd:
+            pass
+        qlr.add_invalidate()
+        qlr.add_initialize()
+        try:
+            qlr.add_switch_mode()
+        except BrotherQLUnsupportedCmd:
+            pass
+
+        qlr.add_status_information()
+        tape_size = label_specs["tape_size"]
+        if label_specs["kind"] in (DIE_CUT_LABEL, ROUND_DIE_CUT_LABEL):
+            qlr.mtype = 0x0B
+            qlr.mwidth = tape_size[0]
+            qlr.mlength = tape_size[1]
+        else:
+            qlr.mtype = 0x0A
+            qlr.mwidth = tape_size[0]
+            qlr.mlength = 0
+        qlr.pquality = 1
+        qlr.add_media_and_quality(rows)
+        try:
+            if cut:
+                qlr.add_autocut(True)
+                qlr.add_cut_every(1)
+        except BrotherQLUnsupportedCmd:
+            pass
+        try:
+            qlr.dpi_600 = False
+            qlr.cut_at_end = cut
+            qlr.two_color_printing = False
+            qlr.add_expanded_mode()
+        except BrotherQLUnsupportedCmd:
+            pass
+        qlr.add_margins(label_specs["feed_margin"])
+
+    def validate_raster(self, raster_data: bytes, label_size: str):
+        """
+        Validate a raw raster instruction blob against this printer and a label size
+
+        Raises:
+            ValueError: If the blob cannot be sent as-is
+        """
+        label_specs = label_type_specs.get(label_size)
+        if not label_specs:
+            raise ValueError(f"Unknown label size '{label_size}'")
+
+        try:
+            instructions = chunker(raster_data, raise_exception=True)
+        except ValueError as e:
+            raise ValueError(f"Invalid raster data: {e}")
+
+        row_len = BrotherQLRaster(self.model).get_pixel_width() // 8
+        two_color = "red" in label_size
+        compressed = False
+        pages = 0
+        page_rows = 0
+        expected_rows = None
+        seen_init = False
+
+        for instruction in instructions:
+            if instruction.startswith(b"\x1b\x40"):
+                seen_init = True
+            elif instruction.startswith(b"\x4d"):
+                compressed = len(instruction) > 1 and bool(instruction[1] & 0x02)
+            elif instruction.startswith(b"\x1b\x69\x7a"):
+                if len(instruction) != 13:
+                    raise ValueError("Truncated media/quality command")
+                if instruction[5] != label_specs["tape_size"][0]:
+                    raise ValueError(
+                        f"Raster is for {instruction[5]}mm media, "
+                        f"label size '{label_size}' is {label_specs['tape_size'][0]}mm"
+                    )
+                die_cut = label_specs["kind"] in (DIE_CUT_LABEL, ROUND_DIE_CUT_LABEL)
+                if instruction[4] != (0x0B if die_cut else 0x0A):
+                    raise ValueError(
+                        f"Raster media type does not match label size '{label_size}'"
+                    )
+                expected_rows = struct.unpack("<L", instruction[7:11])[0]
+                page_rows = 0
+            elif instruction[:1] in (b"\x67", b"\x77"):
+                if instruction[:1] == b"\x77" and (
+                    not two_color or self.model not in two_color_support
+                ):
+                    raise ValueError(
+                        f"Two-color raster data is not supported for '{label_size}' on {self.model}"
+                    )
+                payload = instruction[3:]
+                if len(payload) != instruction[2]:
+                    raise ValueError("Truncated raster row")
+                if compressed:
+                    payload = packbits.decode(payload)
+                if len(payload) != row_len:
+                    raise ValueError(
+                        f"Raster row is {len(payload)} bytes, {self.model} expects {row_len}"
+                    )
+                page_rows += 1
+            elif instruction[:1] in (b"\x0c", b"\x1a"):
+                if expected_rows is None:
+                    raise ValueError("Page printed without media/quality command")
+                if two_color:
+                    page_rows //= 2
+                if page_rows != expected_rows:
+                    raise ValueError(
+                        f"Page has {page_rows} raster rows, header declares {expected_rows}"
+                    )
+                pages += 1
+                expected_rows = None
+
+        if not seen_init:
+            raise ValueError("Raster data is missing the initialize command")
+        if not pages or not instructions[-1].startswith(b"\x1a"):
+            raise ValueError("Raster data must end with a final print command")
+
+    def repeat_label(
+        self, raster_data: bytes, copies: int, cut: str = "each", last: bool = True
+    ) -> bytes:
+        """
+        Repeat the pages of rendered raster data for printing several copies
+
+        The raster rows are reused as they are; only the per-page headers and
+        print commands are adjusted so all copies go out as one print job.
+
+        Args:
+            raster_data: Raster instructions for one label
+            copies: Number of copies to print
+            cut: 'each' to cut after every label, 'end' for one cut after the last
+            last: False for the parts of a run cut at the end that are
+                followed by more; those are not cut at all
+
+        Returns:
+            bytes: Raster instructions for all copies
+
+        Raises:
+            ValueError: If copies is not positive, cut is unknown or a job cut
+                at the end would have more than MAX_CUT_AT_END_LABELS labels
+                (send longer runs as several jobs, see last)
+        """
+        if copies < 1:
+            raise ValueError("copies must be at least 1")
+        if cut not in CUT_MODES:
+            raise ValueError(f"cut must be one of: {', '.join(CUT_MODES)}")
+
+        instructions = chunker(raster_data)
+        first_page = next(
+            (
+                i
+                for i, instruction in enumerate(instructions)
+                if instruction.startswith((b"\x1b\x69\x53", b"\x1b\x69\x7a"))
+            ),
+            None,
+        )
+        if first_page is None:
+            raise ValueError("Raster data does not contain a page")
+
+        preamble = b"".join(instructions[:first_page])
+        pages = []
+        page = []
+        for instruction in instructions[first_page:]:
+            page.append(instruction)
+            if instruction[:1] in (b"\x0c", b"\x1a"):
+                pages.append(page[:-1])
+                page = []
+
+        total = copies * len(pages)
+        if cut == "end" and total > MAX_CUT_AT_END_LABELS:
+            raise ValueError(
+                f"A job cut at the end can have at most {MAX_CUT_AT_END_LABELS} labels"
+            )
+        cut_every = 1 if cut == "each" else total
+        uncut = cut == "end" and not last
+        output = BytesIO()
+        output.write(preamble)
+        for n in range(total):
+            for instruction in pages[n % len(pages)]:
+                if instruction.startswith(b"\x1b\x69\x7a"):
+                    # Byte 11 flags every page but the first one
+                    instruction = (
+                        instruction[:11]
+                        + bytes([0 if n == 0 else 1])
+                        + instruction[12:]
+                    )
+                elif instruction.startswith(b"\x1b\x69\x41"):
+                    instruction = b"\x1b\x69\x41" + bytes([cut_every])
+                elif uncut and instruction.startswith(b"\x1b\x69\x4d"):
+                    # Various mode settings: clear auto cut
+                    instruction = instruction[:3] + bytes([instruction[3] & ~0x40])
+                elif uncut and instruction.startswith(b"\x1b\x69\x4b"):
+                    # Expanded mode: clear cut at end
+                    instruction = instruction[:3] + bytes([instruction[3] & ~0x08])
+                output.write(instruction)
+            output.write(b"\x1a" if n == total - 1 else b"\x0c")
+        return output.getvalue()
+
+    def render_label(
         self,
-        image_data: str,
+        image: Image.Image,
         label_size: str,
         threshold: int = 70,
         rotate: str = "auto",
-    ) -> bool:
+    ) -> bytes:
+        """Rasterize a PIL image into printer instructions"""
+        # Bitmaps of the printable size only skip rasterizing when they are
+        # not to be rotated, as brother_ql leaves such images unrotated
+        if str(rotate) in ("auto", "0") and self.is_prerasterized(image, label_size):
+            logger.debug(f"Using pre-rasterized fast path for {image.size} image")
+            return self.render_prerasterized(image, label_size)
+
+        # Determine if red is in the label size
+        red = "red" in label_size
+
+        # Create raster data
+        qlr = BrotherQLRaster(self.model)
+
+        # Create the label
+        create_label(
+            qlr,
+            image,
+            label_size,
+            threshold=threshold,
+            cut=True,
+            rotate=rotate,
+            red=red,
+        )
+        return qlr.data
+
+    def print_raster(
+        self,
+        raster_data: Union[bytes, Iterable[bytes]],
+        read_status: bool = False,
+        pages: Optional[int] = None,
+    ) -> Optional[Dict[str, Any]]:
         """
-        Print a label directly from image data
+        Send already rendered raster instructions to the printer
+
+        Long runs can be given as an iterable of print jobs, which are
+        written one after the other over the same connection as they are
+        produced.
+
+        Rendered jobs ask the printer for its status, so with read_status the
+        printer's status messages are followed on the same connection until
+        all pages of the job are printed. The last one shows the printer
+        after the job, such as a roll that ran out or a cover opened during
+        it. Printers that do not answer are not waited for again until
+        read_status() reaches them; printers that answer but do not report
+        the end of a job only have the reply read from then on.
 
         Args:
-            image_data: Base64 encoded image data
-            label_size: Size of label to print
-            threshold: Threshold for black/white conversion
-            rotate: Rotation setting ('auto', 0, 90, 180, 270)
+            raster_data: Raster instructions, or an iterable of them
+            read_status: Follow the status of the printer through the job
+            pages: Number of pages in raster_data (default: counted, see
+                count_pages)
 
         Returns:
-            bool: True if successful
+            The last status block the printer sent (see parse_status), if read
         """
+        if isinstance(raster_data, bytes):
+            raster_data = [raster_data]
+        follow = read_status and self.answers_status
+        be = self.backend_class(self.printer_address)
         try:
-            # Decode the image data
-            image = self.decode_base64_image(image_data)
-
-            # Determine if red is in the label size
-            red = "red" in label_size
-
-            # Create raster data
-            qlr = BrotherQLRaster(self.model)
-
-            # Create the label
-            create_label(
-                qlr,
-                image,
-                label_size,
-                threshold=threshold,
-                cut=True,
-                rotate=rotate,
-                red=red,
-            )
-
-            # Print the label
-            be = self.backend_class(self.printer_address)
             time.sleep(0.5)  # this is needed for some reason??
-            be.write(qlr.data)
+            requested = None
+            counted = 0
+            for data in raster_data:
+                # The status request comes right after the invalidate and init
+                if requested is None:
+                    requested = b"\x1b\x69\x53" in data[:512]
+                be.write(data)
+                if follow and self.reports_progress and pages is None:
+                    counted += count_pages(data)
+            if follow and requested:
+                return self._follow_job(be, counted if pages is None else pages)
+            return None
+        finally:
             be.dispose()
 
-            logger.info(
-                f"Label printed successfully (size: {label_size}, threshold: {threshold}, rotate: {rotate})"
-            )
-            return True
+    def _follow_job(self, be: Any, pages: int) -> Optional[Dict[str, Any]]:
+        """Read the status messages of a job until its pages are printed"""
+        status = self._read_status_reply(be, STATUS_REPLY_TIMEOUT)
+        if status is None:
+            logger.info(f"{self.printer_address} does not answer status requests")
+            self.answers_status = False
+            return None
 
-        except Exception as e:
-            logger.error(f"Error printing label: {e}")
-            raise
+        # The reply shows the printer before the job; each printed page is
+        # reported, as is an error ending the job
+        printed = 0
+        while self.reports_progress and printed < pages and not status["errors"]:
+            message = self._read_status_reply(be, PRINT_STATUS_TIMEOUT)
+            if message is None:
+                logger.warning(
+                    f"{self.printer_address} did not report the end of the job"
+                )
+                self.reports_progress = False
+                break
+            status = message
+            if status["status_type"] == "Printing completed":
+                printed += 1
+        return status
+
+    def read_status(self, timeout: float = 2.0) -> Dict[str, Any]:
+        """
+        Ask the printer for its status block (loaded media, errors)
+
+        Raises:
+            TimeoutError: If the printer does not answer
+        """
+        be = self.backend_class(self.printer_address)
+        try:
+            be.write(STATUS_REQUEST)
+            status = self._read_status_reply(be, timeout)
+        finally:
+            be.dispose()
+        if status is None:
+            raise TimeoutError(f"No status from {self.printer_address}")
+        self.answers_status = True
+        return status
+
+    def _read_status_reply(self, be: Any, timeout: float) -> Optional[Dict[str, Any]]:
+        data = b""
+        deadline = time.monotonic() + timeout
+        while len(data) < STATUS_LENGTH and time.monotonic() < deadline:
+            chunk = be.read(STATUS_LENGTH - len(data))
+            if chunk:
+                data += chunk
+            else:
+                time.sleep(0.01)
+        if len(data) < STATUS_LENGTH:
+            return None
+        try:
+            return parse_status(data)
+        except ValueError as e:
+            logger.warning(f"Invalid status from {self.printer_address}: {e}")
+            return None
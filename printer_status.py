@@ -0,0 +1,71 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+
+class PrinterStatusCache:
+    """Recently read status blocks of printers, by printer address
+
+    Reading a status takes a round trip to the printer, so it is kept for
+    ttl seconds. Printers used with "auto" label sizes are tracked: their
+    entry is refreshed after every job from the status the job brings back
+    anyway, so a stream of jobs keeps it fresh without extra requests.
+    """
+
+    def __init__(self, ttl: float = 30):
+        self.ttl = ttl
+        self._statuses: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._tracked: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def peek(self, address: str) -> Optional[Dict[str, Any]]:
+        """The cached status if it is fresh, without asking the printer"""
+        entry = self._statuses.get(address)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    def get(
+        self,
+        address: str,
+        read: Callable[[], Dict[str, Any]],
+        refresh: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        The status of a printer, read with read() unless a fresh one is cached
+
+        Concurrent callers for the same printer share one read.
+
+        Raises:
+            Whatever read() raises
+        """
+        if not refresh:
+            status = self.peek(address)
+            if status is not None:
+                return status
+
+        with self._lock:
+            lock = self._locks.setdefault(address, threading.Lock())
+        requested = time.monotonic()
+        with lock:
+            # Someone else may have read it while we waited
+            entry = self._statuses.get(address)
+            if entry and entry[0] >= requested:
+                return entry[1]
+            status = read()
+            self.update(address, status)
+            return status
+
+    def update(self, address: str, status: Dict[str, Any]):
+        """Store a status read from the printer"""
+        status["read_at"] = time.time()
+        self._statuses[address] = (time.monotonic(), status)
+
+    def track(self, address: str):
+        """Keep the status of a printer up to date from its jobs"""
+        self._tracked.add(address)
+
+    def tracked(self, address: str) -> bool:
+        """Whether the jobs of a printer should bring back its status"""
+        return address in self._tracked
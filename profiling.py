@@ -0,0 +1,295 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Any
+
+from bottle import request
+
+logger = logging.getLogger(__name__)
+
+# Sampling intervals allowed, in seconds
+MIN_INTERVAL = 0.001
+MAX_INTERVAL = 1.0
+
+_local = threading.local()
+
+
+@contextmanager
+def stage(name: str):
+    """Time a stage of the current request for the slow request log"""
+    stages = getattr(_local, "stages", None)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if stages is not None:
+            stages.append((name, time.perf_counter() - started))
+
+
+class _SamplingProfiler(threading.Thread):
+    """Samples the stacks of all threads at a fixed interval"""
+
+    def __init__(self, interval: float, max_depth: int = 64):
+        super().__init__(name="sampling-profiler", daemon=True)
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.self_counts: Counter = Counter()
+        self.total_counts: Counter = Counter()
+        self.stacks: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_id = threading.get_ident()
+        while not self._stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(
+                        f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+                    )
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                self.self_counts[stack[0]] += 1
+                for entry in set(stack):
+                    self.total_counts[entry] += 1
+                thread_name = names.get(thread_id, str(thread_id))
+                self.stacks[";".join([thread_name] + stack[::-1])] += 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class Profiler:
+    """On-demand profiling of the running server and a slow request log
+
+    A profiling session either runs cProfile around the next requests handled
+    by bottle, or samples the stacks of every thread (request handlers and the
+    zeroconf discovery threads alike). Sessions end after a number of requests
+    or seconds; results are kept in memory and written to output_dir.
+    """
+
+    def __init__(
+        self,
+        output_dir: str = "profiles",
+        slow_request_threshold: float = 1.0,
+        slow_request_log_size: int = 100,
+    ):
+        self.output_dir = output_dir
+        self.slow_request_threshold = slow_request_threshold
+        self.slow_requests: deque = deque(maxlen=slow_request_log_size)
+        self.session: Optional[Dict[str, Any]] = None
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[_SamplingProfiler] = None
+        self._remaining_requests: Optional[int] = None
+        self._deadline: Optional[float] = None
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+
+    def start(
+        self,
+        mode: str = "cprofile",
+        requests: Optional[int] = None,
+        seconds: Optional[float] = None,
+        interval: float = 0.005,
+    ) -> Dict[str, Any]:
+        """
+        Start a profiling session ending after `requests` requests or `seconds`
+
+        Raises:
+            ValueError: If an argument is invalid or a session is running
+        """
+        if mode not in ("cprofile", "sampling"):
+            raise ValueError("mode must be 'cprofile' or 'sampling'")
+        if requests is not None and (
+            not isinstance(requests, int) or isinstance(requests, bool) or requests < 1
+        ):
+            raise ValueError("requests must be a positive integer")
+        if seconds is not None and (
+            not isinstance(seconds, (int, float))
+            or isinstance(seconds, bool)
+            or seconds <= 0
+        ):
+            raise ValueError("seconds must be a positive number")
+        if (
+            not isinstance(interval, (int, float))
+            or isinstance(interval, bool)
+            or not MIN_INTERVAL <= interval <= MAX_INTERVAL
+        ):
+            raise ValueError(
+                f"interval must be between {MIN_INTERVAL} and {MAX_INTERVAL} seconds"
+            )
+        if not requests and not seconds:
+            raise ValueError("requests or seconds is required")
+        if mode == "sampling" and not seconds:
+            raise ValueError("sampling sessions need seconds")
+
+        with self._lock:
+            if self.session and self.session["state"] == "running":
+                raise ValueError("A profiling session is already running")
+
+            # Set up before the session counts as running
+            profile, sampler = None, None
+            if mode == "cprofile":
+                profile = cProfile.Profile()
+            else:
+                sampler = _SamplingProfiler(interval)
+                sampler.start()
+
+            self.session = {
+                "mode": mode,
+                "state": "running",
+                "started_at": time.time(),
+                "requests": requests,
+                "seconds": seconds,
+                "profiled_requests": 0,
+            }
+            self._remaining_requests = requests
+            self._deadline = time.monotonic() + seconds if seconds else None
+            self._profile = profile
+            self._sampler = sampler
+
+        if seconds:
+            timer = threading.Timer(seconds, self._finish_if_due)
+            timer.daemon = True
+            timer.start()
+
+        logger.info(f"Profiling session started: {self.session}")
+        return dict(self.session)
+
+    def _finish_if_due(self):
+        with self._lock:
+            if self.session and self.session["state"] == "running":
+                self._finish()
+
+    def _finish(self):
+        """Stop the running session and store its results (lock must be held)"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+
+        if self._profile is not None:
+            # Wait for a request still being profiled
+            with self._profile_lock:
+                profile, self._profile = self._profile, None
+            path = os.path.join(self.output_dir, f"profile-{stamp}.prof")
+            stream = io.StringIO()
+            try:
+                stats = pstats.Stats(profile, stream=stream)
+                stats.dump_stats(path)
+                stats.sort_stats("cumulative").print_stats(40)
+                self.session["report"] = stream.getvalue()
+            except TypeError:
+                # Nothing was profiled
+                path = None
+                self.session["report"] = ""
+        else:
+            sampler, self._sampler = self._sampler, None
+            sampler.stop()
+            path = os.path.join(self.output_dir, f"profile-{stamp}.folded")
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, count in sampler.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.session["samples"] = sampler.samples
+            self.session["top_self"] = sampler.self_counts.most_common(40)
+            self.session["top_total"] = sampler.total_counts.most_common(40)
+
+        self.session["state"] = "finished"
+        self.session["finished_at"] = time.time()
+        self.session["output_file"] = path
+        logger.info(f"Profiling session finished, results saved to {path}")
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        """Stop the running session early"""
+        with self._lock:
+            if self.session and self.session["state"] == "running":
+                self._finish()
+            return dict(self.session) if self.session else None
+
+    def status(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return dict(self.session) if self.session else None
+
+    def plugin(self, callback):
+        """Bottle plugin timing every request and profiling it when asked to"""
+
+        def wrapper(*args, **kwargs):
+            _local.stages = []
+            started = time.perf_counter()
+            profile = self._claim_profile()
+            try:
+                if profile is not None:
+                    profile.enable()
+                try:
+                    return callback(*args, **kwargs)
+                finally:
+                    if profile is not None:
+                        profile.disable()
+                        self._release_profile()
+            finally:
+                elapsed = time.perf_counter() - started
+                stages = _local.stages
+                _local.stages = None
+                if (
+                    self.slow_request_threshold
+                    and elapsed >= self.slow_request_threshold
+                ):
+                    self._log_slow_request(
+                        request.method, request.path, elapsed, stages
+                    )
+
+        return wrapper
+
+    def _claim_profile(self) -> Optional[cProfile.Profile]:
+        """Return the cProfile to use for this request, if any"""
+        if self._profile is None:
+            return None
+        with self._lock:
+            if self._profile is None or self.session["state"] != "running":
+                return None
+            if self._deadline and time.monotonic() >= self._deadline:
+                self._finish()
+                return None
+            # cProfile can only follow one thread at a time
+            if not self._profile_lock.acquire(blocking=False):
+                return None
+            self.session["profiled_requests"] += 1
+            return self._profile
+
+    def _release_profile(self):
+        self._profile_lock.release()
+        with self._lock:
+            if self._remaining_requests is not None and self._profile is not None:
+                self._remaining_requests -= 1
+                if self._remaining_requests <= 0:
+                    self._finish()
+
+    def _log_slow_request(self, method: str, path: str, elapsed: float, stages: List):
+        # Stages repeat for every part of a multi-part job; they are summed
+        stages_ms: Dict[str, float] = {}
+        for name, seconds in stages:
+            stages_ms[name] = stages_ms.get(name, 0) + seconds * 1000
+        entry = {
+            "time": time.time(),
+            "method": method,
+            "path": path,
+            "duration_ms": round(elapsed * 1000, 1),
+            "stages_ms": {name: round(ms, 1) for name, ms in stages_ms.items()},
+        }
+        self.slow_requests.append(entry)
+        logger.warning(
+            f"Slow request {method} {path}: {entry['duration_ms']} ms, stages: {entry['stages_ms']}"
+        )
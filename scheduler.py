@@ -0,0 +1,307 @@
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes and their share of a busy printer
+LANE_WEIGHTS = {"urgent": 16, "normal": 4, "bulk": 1}
+DEFAULT_PRIORITY = "normal"
+
+# Weight of the newest sample in the seconds-per-label moving average
+EWMA_WEIGHT = 0.2
+
+
+class _Waiter:
+    def __init__(self, lane: str, deadline: Optional[float], labels: int, seq: int):
+        self.lane = lane
+        self.deadline = deadline
+        self.labels = labels
+        self.seq = seq
+        self.granted = threading.Event()
+
+    def sort_key(self):
+        # Earliest deadline first, then first come first served
+        return (self.deadline if self.deadline is not None else math.inf, self.seq)
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return self.sort_key() < other.sort_key()
+
+
+class _PrinterQueue:
+    """Waiting jobs of one printer, by lane (scheduler lock must be held)"""
+
+    def __init__(self):
+        self.busy = False
+        self.lanes: Dict[str, List[_Waiter]] = {lane: [] for lane in LANE_WEIGHTS}
+        # Stride scheduling: the active lane with the lowest pass goes next
+        self.passes: Dict[str, float] = {lane: 0.0 for lane in LANE_WEIGHTS}
+        # Unknown until the first job is printed
+        self.seconds_per_label: Optional[float] = None
+        self.missed_deadlines = 0
+
+    def waiting(self) -> int:
+        return sum(len(waiters) for waiters in self.lanes.values())
+
+    def estimate(self, labels: int) -> float:
+        return (self.seconds_per_label or 1.0) * labels
+
+
+class PrintSlot:
+    """A job's turn on a printer; enter it around every printer session
+
+    Multi-copy runs check more_urgent_waiting() between their parts (see
+    PrintScheduler.chunk_labels) and, if so, end the session and enter the
+    slot again for the rest, so the waiting job goes in between.
+    """
+
+    def __init__(
+        self,
+        scheduler: "PrintScheduler",
+        printer: str,
+        priority: str,
+        deadline: Optional[float],
+        labels: int,
+    ):
+        self.scheduler = scheduler
+        self.printer = printer
+        self.priority = priority
+        self.deadline = deadline
+        self.labels = labels
+        self.waited = 0.0
+        self.deadline_at_risk = False
+        self.deadline_missed = False
+        self._started = 0.0
+        self._part_labels = labels
+
+    def part(self, labels: int) -> "PrintSlot":
+        """Set the number of labels of the next session"""
+        self._part_labels = labels
+        return self
+
+    def more_urgent_waiting(self) -> bool:
+        """Whether a job of a higher lane or an earlier deadline waits"""
+        return self.scheduler._more_urgent_waiting(self)
+
+    def __enter__(self):
+        started = time.monotonic()
+        self.deadline_at_risk |= self.scheduler._acquire(self)
+        self._started = time.monotonic()
+        self.waited += self._started - started
+        return self
+
+    def __exit__(self, *exc_info):
+        self.scheduler._release(self, time.monotonic() - self._started)
+        if self.deadline is not None and time.time() > self.deadline:
+            self.deadline_missed = True
+
+    def report(self) -> Dict[str, object]:
+        """Scheduling details for the response of a print request"""
+        result: Dict[str, object] = {
+            "priority": self.priority,
+            "queued_seconds": round(self.waited, 3),
+        }
+        if self.deadline is not None:
+            result["deadline_at_risk"] = self.deadline_at_risk
+            result["deadline_missed"] = self.deadline_missed
+        return result
+
+
+class PrintScheduler:
+    """Decides which waiting job prints next on each printer
+
+    Jobs wait in priority lanes (urgent, normal, bulk). A busy printer serves
+    the lanes in proportion to LANE_WEIGHTS (stride scheduling), so urgent
+    jobs go first most of the time while bulk runs keep moving. Within a lane
+    the job with the earliest deadline goes first. A job that would miss its
+    deadline if it waited for one more job goes next regardless of its lane,
+    as long as it can still make it; jobs that cannot are only flagged.
+    Multi-copy runs are sent in parts of chunk_labels labels (0: all at
+    once) over one printer session; a run cut after every label makes way
+    between two parts when a more urgent job is waiting.
+    """
+
+    def __init__(self, chunk_labels: int = 20):
+        self.chunk_labels = chunk_labels
+        self._lock = threading.Lock()
+        self._printers: Dict[str, _PrinterQueue] = {}
+        self._seq = itertools.count()
+
+    def slot(
+        self,
+        printer: str,
+        priority: str = DEFAULT_PRIORITY,
+        deadline: Optional[float] = None,
+        labels: int = 1,
+    ) -> PrintSlot:
+        """
+        Create the slot of a job of labels labels
+
+        Args:
+            printer: Printer the job is for
+            priority: Lane of the job, one of LANE_WEIGHTS
+            deadline: Unix time the job should be printed by
+            labels: Number of labels, for estimating the print time
+
+        Raises:
+            ValueError: If the priority is unknown
+        """
+        if priority not in LANE_WEIGHTS:
+            raise ValueError(f"priority must be one of: {', '.join(LANE_WEIGHTS)}")
+        return PrintSlot(self, printer, priority, deadline, labels)
+
+    def _acquire(self, slot: PrintSlot) -> bool:
+        """Wait for the printer; returns whether the deadline is at risk"""
+        with self._lock:
+            queue = self._printers.get(slot.printer)
+            if queue is None:
+                queue = self._printers[slot.printer] = _PrinterQueue()
+            at_risk = slot.deadline is not None and (
+                time.time() + self._estimate_wait(queue, slot) > slot.deadline
+            )
+            if not queue.busy and not queue.waiting():
+                queue.busy = True
+                return at_risk
+
+            lane = queue.lanes[slot.priority]
+            if not lane:
+                # A lane coming back from idle must not spend banked credit
+                active = [
+                    queue.passes[name]
+                    for name, waiters in queue.lanes.items()
+                    if waiters
+                ]
+                if active:
+                    queue.passes[slot.priority] = max(
+                        queue.passes[slot.priority], min(active)
+                    )
+            waiter = _Waiter(
+                slot.priority, slot.deadline, slot._part_labels, next(self._seq)
+            )
+            heapq.heappush(lane, waiter)
+
+        if at_risk:
+            logger.warning(
+                f"{slot.priority} job for '{slot.printer}' will likely miss its deadline"
+            )
+        waiter.granted.wait()
+        return at_risk
+
+    def _more_urgent_waiting(self, slot: PrintSlot) -> bool:
+        """A higher lane, an earlier deadline in the same lane or a critical one"""
+        with self._lock:
+            queue = self._printers.get(slot.printer)
+            if queue is None:
+                return False
+            weight = LANE_WEIGHTS[slot.priority]
+            deadline = slot.deadline if slot.deadline is not None else math.inf
+            now = time.time()
+            next_job = queue.estimate(max(self.chunk_labels, 1))
+            for name, waiters in queue.lanes.items():
+                if not waiters:
+                    continue
+                # Each lane is a heap ordered by deadline, so its head is enough
+                waiter = waiters[0]
+                if (
+                    LANE_WEIGHTS[name] > weight
+                    or (name == slot.priority and waiter.sort_key()[0] < deadline)
+                    or self._critical(queue, waiter, now, next_job)
+                ):
+                    return True
+            return False
+
+    @staticmethod
+    def _critical(
+        queue: _PrinterQueue, waiter: _Waiter, now: float, next_job: float
+    ) -> bool:
+        """Whether the job makes its deadline now but not after one more job"""
+        if waiter.deadline is None:
+            return False
+        finish = now + queue.estimate(waiter.labels)
+        return finish <= waiter.deadline < finish + next_job
+
+    def _estimate_wait(self, queue: _PrinterQueue, slot: PrintSlot) -> float:
+        """Seconds until the job is printed, counting the jobs that go first"""
+        labels = slot.labels + (max(self.chunk_labels, 1) if queue.busy else 0)
+        rank = list(LANE_WEIGHTS).index(slot.priority)
+        for name, waiters in queue.lanes.items():
+            if list(LANE_WEIGHTS).index(name) <= rank:
+                labels += sum(
+                    waiter.labels
+                    for waiter in waiters
+                    if name != slot.priority
+                    or waiter.sort_key() < (slot.deadline or math.inf, math.inf)
+                )
+        return queue.estimate(labels)
+
+    def _release(self, slot: PrintSlot, seconds: float):
+        with self._lock:
+            queue = self._printers[slot.printer]
+            if slot._part_labels:
+                sample = seconds / slot._part_labels
+                if queue.seconds_per_label is None:
+                    queue.seconds_per_label = sample
+                else:
+                    queue.seconds_per_label += EWMA_WEIGHT * (
+                        sample - queue.seconds_per_label
+                    )
+            if (
+                slot.deadline is not None
+                and not slot.deadline_missed
+                and time.time() > slot.deadline
+            ):
+                queue.missed_deadlines += 1
+
+            waiter = self._next_waiter(queue)
+            if waiter is None:
+                queue.busy = False
+                return
+        # The printer stays busy and passes straight to the next job
+        waiter.granted.set()
+
+    def _next_waiter(self, queue: _PrinterQueue) -> Optional[_Waiter]:
+        active = [name for name, waiters in queue.lanes.items() if waiters]
+        if not active:
+            return None
+
+        now = time.time()
+        next_job = queue.estimate(max(self.chunk_labels, 1))
+        critical = None
+        for name in active:
+            # Each lane is a heap ordered by deadline, so its head is enough
+            waiter = queue.lanes[name][0]
+            if self._critical(queue, waiter, now, next_job) and (
+                critical is None or waiter.deadline < critical.deadline
+            ):
+                critical = waiter
+
+        lane = (
+            critical.lane
+            if critical
+            else min(active, key=lambda name: (queue.passes[name], -LANE_WEIGHTS[name]))
+        )
+        queue.passes[lane] += 1 / LANE_WEIGHTS[lane]
+        return heapq.heappop(queue.lanes[lane])
+
+    def status(self) -> Dict[str, Dict[str, object]]:
+        """Queue lengths per printer and lane"""
+        with self._lock:
+            return {
+                printer: {
+                    "busy": queue.busy,
+                    "waiting": {
+                        lane: len(waiters) for lane, waiters in queue.lanes.items()
+                    },
+                    "seconds_per_label": (
+                        round(queue.seconds_per_label, 3)
+                        if queue.seconds_per_label is not None
+                        else None
+                    ),
+                    "missed_deadlines": queue.missed_deadlines,
+                }
+                for printer, queue in self._printers.items()
+            }
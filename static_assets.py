@@ -0,0 +1,207 @@
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+from bottle import HTTPResponse, request
+
+try:
+    import brotli
+except ImportError:  # Optional, gzip is used without it
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Files worth compressing; images and woff/woff2 fonts are compressed already
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "image/svg+xml",
+    "application/vnd.ms-fontobject",
+    "font/ttf",
+    "application/x-font-ttf",
+)
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)([^'")?#]+)([^'")]*)\1\s*\)""")
+
+
+class Asset:
+    """A file held in memory with its compressed variants"""
+
+    def __init__(self, path: str, content: bytes, mimetype: Optional[str] = None):
+        self.path = path
+        self.content = content
+        self.mimetype = (
+            mimetype or mimetypes.guess_type(path)[0] or "application/octet-stream"
+        )
+        self.digest = hashlib.sha256(content).hexdigest()[:12]
+        root, ext = posixpath.splitext(path)
+        self.hashed_path = f"{root}.{self.digest}{ext}"
+        # Filled in by compress(); until then the content is sent as is
+        self.variants: Dict[str, bytes] = {}
+
+    def compress(self, min_size: int = 512):
+        """Precompute the gzip and brotli variants that are smaller"""
+        if len(self.content) < min_size or not self.mimetype.startswith(
+            COMPRESSIBLE_TYPES
+        ):
+            return
+        variants = {}
+        compressed = gzip.compress(self.content, compresslevel=9, mtime=0)
+        if len(compressed) < len(self.content):
+            variants["gzip"] = compressed
+        if brotli:
+            compressed = brotli.compress(self.content, quality=11)
+            if len(compressed) < len(self.content):
+                variants["br"] = compressed
+        self.variants = variants
+
+    def respond(self, immutable: bool = False) -> HTTPResponse:
+        """Build the response for the current request (304, compressed or plain)"""
+        headers = {
+            "Cache-Control": IMMUTABLE if immutable else REVALIDATE,
+            "Vary": "Accept-Encoding",
+        }
+        encoding = _choose_encoding(self.variants)
+        etag = f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+        headers["ETag"] = etag
+
+        if _etag_matches(request.get_header("If-None-Match"), self.digest):
+            return HTTPResponse(status=304, headers=headers)
+
+        body = self.variants[encoding] if encoding else self.content
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        headers["Content-Type"] = self.mimetype + (
+            "; charset=UTF-8" if self.mimetype.startswith("text/") else ""
+        )
+        headers["Content-Length"] = str(len(body))
+        return HTTPResponse(body, headers=headers)
+
+
+def _choose_encoding(variants: Dict[str, bytes]) -> Optional[str]:
+    """Pick the best precompressed variant the client accepts"""
+    if not variants:
+        return None
+    accepted = set()
+    for token in (request.get_header("Accept-Encoding") or "").split(","):
+        name, _, params = token.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+    for encoding in ("br", "gzip"):
+        if encoding in variants and encoding in accepted:
+            return encoding
+    return None
+
+
+def _etag_matches(if_none_match: Optional[str], digest: str) -> bool:
+    """Any representation of the same content counts as a match"""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"').split("-", 1)[0] == digest:
+            return True
+    return False
+
+
+class StaticAssets:
+    """Static files served from memory with hashed URLs and precompression
+
+    All files below root are read once. Each file is reachable under its
+    plain name (revalidated with ETags on every use) and under a name with
+    its content hash (cached forever by browsers); templates link to the
+    hashed names through url(). References between files in CSS url()s are
+    rewritten to the hashed names as well. gzip, and brotli when installed,
+    variants are computed in the background after loading.
+    """
+
+    def __init__(self, root: str, prefix: str = "/static/"):
+        self.root = root
+        self.prefix = prefix
+        self._assets: Dict[str, Asset] = {}
+        self._hashed: Dict[str, Asset] = {}
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def load(self, background: bool = True):
+        """Read all files and compress them (in a background thread by default)"""
+        with self._lock:
+            if self._loaded:
+                return
+            files = {}
+            for directory, _, filenames in os.walk(self.root):
+                for filename in filenames:
+                    full_path = os.path.join(directory, filename)
+                    path = os.path.relpath(full_path, self.root).replace(os.sep, "/")
+                    with open(full_path, "rb") as f:
+                        files[path] = f.read()
+
+            # Stylesheets last, so their url()s can point to hashed names
+            assets = {}
+            for path in sorted(files, key=lambda p: p.endswith(".css")):
+                content = files[path]
+                if path.endswith(".css"):
+                    content = self._rewrite_css(path, content, assets)
+                assets[path] = Asset(path, content)
+
+            self._assets = assets
+            self._hashed = {asset.hashed_path: asset for asset in assets.values()}
+            self._loaded = True
+        logger.info(f"Loaded {len(assets)} static assets")
+
+        if background:
+            threading.Thread(
+                target=self._compress_all, name="compress-static-assets", daemon=True
+            ).start()
+        else:
+            self._compress_all()
+
+    def _rewrite_css(
+        self, path: str, content: bytes, assets: Dict[str, Asset]
+    ) -> bytes:
+        """Point url()s in a stylesheet to the hashed names of the files"""
+        base = posixpath.dirname(path)
+
+        def replace(match):
+            quote, target, suffix = match.groups()
+            resolved = posixpath.normpath(posixpath.join(base, target))
+            asset = assets.get(resolved)
+            if not asset:
+                return match.group(0)
+            return f"url({quote}{self.prefix}{asset.hashed_path}{suffix}{quote})"
+
+        return _CSS_URL.sub(replace, content.decode("utf-8")).encode("utf-8")
+
+    def _compress_all(self):
+        for asset in list(self._assets.values()):
+            asset.compress()
+        logger.info("Compressed static assets")
+
+    def url(self, path: str) -> str:
+        """URL of a static file that can be cached forever"""
+        self.load()
+        asset = self._assets.get(path)
+        return self.prefix + (asset.hashed_path if asset else path)
+
+    def lookup(self, path: str) -> Tuple[Optional[Asset], bool]:
+        """Find a file by plain or hashed name; returns (asset, hashed)"""
+        self.load()
+        asset = self._hashed.get(path)
+        if asset:
+            return asset, True
+        return self._assets.get(path), False
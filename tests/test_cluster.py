@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import brother_ql_web
+from cluster import ClusterNode, SQLiteClusterStore
+from printer_discovery import PrinterInfo
+from printer_manager import PrinterManager
+
+
+def _manager(directory):
+    directory.mkdir()
+    manager = PrinterManager(None)
+    manager.printer_configs_file = str(directory / "printer_configs.json")
+    manager.discovered_printers_file = str(directory / "discovered_printers.json")
+    return manager
+
+
+def _discover(manager, printer_info):
+    service = manager.discovery_service
+    with service._lock:
+        service._replace_printers({**service.printers, printer_info.name: printer_info})
+    manager._on_printer_found(printer_info)
+
+
+@pytest.fixture
+def nodes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = SQLiteClusterStore(str(tmp_path / "cluster.sqlite3"))
+    nodes = [
+        ClusterNode(store, name, f"http://{name}:8013", _manager(tmp_path / name), 60)
+        for name in ("node-a", "node-b")
+    ]
+    for node in nodes:
+        node.start()
+    yield nodes
+    for node in nodes:
+        node.stop()
+    store.close()
+
+
+def test_printer_discovered_by_another_node_is_forwarded(nodes, monkeypatch):
+    node_a, node_b = nodes
+    _discover(
+        node_b.printer_manager, PrinterInfo("ql-820", "10.0.0.5", 9100, "QL-820NWB")
+    )
+    node_b._tick()
+    node_a._tick()
+
+    forwarded = []
+
+    def forward(owner_url, path, body):
+        forwarded.append((owner_url, path, json.loads(body)))
+        return 200, {"success": True, "job_id": "job-b"}
+
+    monkeypatch.setattr(node_a, "forward", forward)
+    monkeypatch.setattr(brother_ql_web, "printer_manager", node_a.printer_manager)
+    monkeypatch.setattr(brother_ql_web, "cluster_node", node_a)
+
+    params = {"printer": "ql-820", "copies": 2, "raster": False, "id": "frame-1"}
+    result = brother_ql_web._print_job(params, b"png", None)
+
+    assert result == {"job_id": "job-b", "copies": 2}
+    assert forwarded == [
+        (
+            "http://node-b:8013",
+            "/api/print",
+            {"printer": "ql-820", "copies": 2, "image": "cG5n"},
+        )
+    ]
+
+
+def test_unknown_printer_is_not_found(nodes, monkeypatch):
+    node_a, _ = nodes
+    monkeypatch.setattr(brother_ql_web, "printer_manager", node_a.printer_manager)
+    monkeypatch.setattr(brother_ql_web, "cluster_node", node_a)
+
+    with pytest.raises(brother_ql_web.PrintRequestError, match="not found"):
+        brother_ql_web._resolve_print_job({"printer": "ql-820"})
+
+
+def test_config_changes_of_both_nodes_are_kept(nodes):
+    node_a, node_b = nodes
+    node_a.printer_manager.import_printers(
+        [{"printer_id": "site-a-01", "address": "10.0.0.7", "display_name": "Packing"}]
+    )
+    # Saved before node-b pulled the change of node-a
+    _discover(
+        node_b.printer_manager, PrinterInfo("ql-820", "10.0.0.5", 9100, "QL-820NWB")
+    )
+
+    for node in nodes:
+        node._tick()
+        display_names = node.printer_manager.snapshot.display_names
+        assert display_names["site-a-01"] == "Packing"
+        assert display_names["ql-820"] == "ql-820"
@@ -0,0 +1,27 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from labelserver_client import AsyncLabelServerClient
+
+
+def test_async_close_waits_for_batches_on_their_way():
+    async def main():
+        client = AsyncLabelServerClient("http://127.0.0.1:1", batch_size=2, linger=5)
+
+        async def print_batch(labels):
+            await asyncio.sleep(0.1)
+            return [{"status": 200, "job_id": str(i)} for i in range(len(labels))]
+
+        client.print_batch = print_batch
+        futures = [client.submit(b"label") for _ in range(5)]
+        # Two full batches are sent right away, one label waits for the linger
+        assert len(client._tasks) == 2
+        await client.close()
+        return futures, client
+
+    futures, client = asyncio.run(main())
+    assert [future.result()["status"] for future in futures] == [200] * 5
+    assert not client._tasks
@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from printer_discovery import PrinterInfo
+from printer_manager import PrinterManager
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    # The configuration files live in the working directory
+    monkeypatch.chdir(tmp_path)
+    return PrinterManager(None)
+
+
+def _discover(manager, printer_info):
+    service = manager.discovery_service
+    with service._lock:
+        service._replace_printers({**service.printers, printer_info.name: printer_info})
+    manager._on_printer_found(printer_info)
+
+
+def test_saved_printers_online_are_seen_now(manager):
+    week_ago = time.time() - 8 * 24 * 3600
+    printer_info = PrinterInfo("ql-820", "10.0.0.5", 9100, "QL-820NWB")
+    printer_info.last_seen = week_ago
+    _discover(manager, printer_info)
+
+    manager._save_discovered_printers()
+
+    # Found long ago but still online, so it is loaded after a crash
+    printers = PrinterManager(None).snapshot.printers
+    assert printers["ql-820"].status == "Cached"
+    assert printers["ql-820"].last_seen > week_ago
+
+
+def test_cached_printers_keep_their_last_seen(manager):
+    day_ago = time.time() - 24 * 3600
+    printer_info = PrinterInfo("ql-700", "10.0.0.6", 9100, "QL-700")
+    printer_info.last_seen = day_ago
+    manager.discovery_service.add_cached_printers([printer_info])
+    with manager._lock:
+        manager._publish()
+
+    manager._save_discovered_printers()
+
+    printers = PrinterManager(None).snapshot.printers
+    assert printers["ql-700"].last_seen == day_ago
+
+
+@pytest.mark.parametrize(
+    "definition, error",
+    [
+        ({"port": True}, "port must be an integer between 1 and 65535"),
+        ({"port": 0}, "port must be an integer between 1 and 65535"),
+        ({"display_name": {"a": 1}}, "display_name must be a non-empty string"),
+        ({"display_name": ""}, "display_name must be a non-empty string"),
+    ],
+)
+def test_import_rejects_invalid_definitions(manager, definition, error):
+    definition = {"printer_id": "site-a-01", "address": "10.0.0.7", **definition}
+
+    imported, errors = manager.import_printers([definition])
+
+    assert imported == 0
+    assert [e["error"] for e in errors] == [error]
+    assert "site-a-01" not in manager.snapshot.printers
+
+
+def test_import_adds_valid_definitions(manager):
+    definition = {
+        "printer_id": "site-a-01",
+        "address": "10.0.0.7",
+        "port": 9100,
+        "display_name": "Site A Packing 1",
+    }
+
+    assert manager.import_printers([definition]) == (1, [])
+    printer_info = manager.snapshot.printers["site-a-01"]
+    assert printer_info.to_dict()["connection_string"] == "tcp://10.0.0.7:9100"
+    assert manager.snapshot.display_names["site-a-01"] == "Site A Packing 1"
@@ -0,0 +1,176 @@
+import os
+import sys
+
+import pytest
+from brother_ql.reader import chunker
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from printer_service import LabelPrinterService, count_pages
+
+
+def test_prerasterized_rejects_label_wider_than_print_head():
+    # 102mm labels are 1164 dots wide, the QL-500 print head has 720
+    service = LabelPrinterService("QL-500", "tcp://127.0.0.1", None)
+    image = Image.new("1", (1164, 100), 1)
+
+    assert not service.is_prerasterized(image, "102")
+    with pytest.raises(ValueError, match="Wrong pixel width: 1164, expected 720"):
+        service.check_label_width("102")
+    with pytest.raises(ValueError, match="Wrong pixel width"):
+        service.render_prerasterized(image, "102")
+
+
+def test_prerasterized_accepts_label_fitting_print_head():
+    service = LabelPrinterService("QL-1050", "tcp://127.0.0.1", None)
+    image = Image.new("1", (1164, 100), 1)
+
+    assert service.is_prerasterized(image, "102")
+    service.validate_raster(service.render_prerasterized(image, "102"), "102")
+
+
+def test_render_label_rotates_printable_width_bitmaps():
+    service = LabelPrinterService("QL-700", "tcp://127.0.0.1", None)
+    image = Image.new("1", (696, 300), 1)
+    image.paste(0, (0, 0, 100, 20))
+    fast = service.render_prerasterized(image, "62")
+
+    assert service.render_label(image, "62") == fast
+    assert service.render_label(image, "62", rotate="0") == fast
+    rotated = service.render_label(image, "62", rotate=90)
+    assert rotated != fast
+    service.validate_raster(rotated, "62")
+
+
+def test_decode_base64_raster_rejects_invalid_data():
+    service = LabelPrinterService("QL-700", "tcp://127.0.0.1", None)
+
+    assert service.decode_base64_raster("data:image/png;base64,YWJj") == b"abc"
+    with pytest.raises(ValueError):
+        service.decode_base64_raster("!!!notbase64")
+
+
+def _commands(raster_data, prefix):
+    return [i for i in chunker(raster_data) if i.startswith(prefix)]
+
+
+def test_repeat_label_flags_pages_and_cuts_each():
+    service = LabelPrinterService("QL-700", "tcp://127.0.0.1", None)
+    label = service.render_label(Image.new("L", (696, 100), 255), "62")
+    output = service.repeat_label(label, 3, "each")
+
+    service.validate_raster(output, "62")
+    # Byte 11 of the media and quality command flags all pages but the first
+    assert [i[11] for i in _commands(output, b"\x1b\x69\x7a")] == [0, 1, 1]
+    assert _commands(output, b"\x1b\x69\x41") == [b"\x1b\x69\x41\x01"] * 3
+    assert output.count(b"\x0c") == 2 and output.endswith(b"\x1a")
+
+
+def test_repeat_label_cuts_at_end():
+    service = LabelPrinterService("QL-700", "tcp://127.0.0.1", None)
+    label = service.render_label(Image.new("L", (696, 100), 255), "62")
+
+    output = service.repeat_label(label, 255, "end")
+    assert set(_commands(output, b"\x1b\x69\x41")) == {b"\x1b\x69\x41\xff"}
+    # Longer runs are sent as several jobs, as the printer would cut every 255
+    with pytest.raises(ValueError, match="at most 255 labels"):
+        service.repeat_label(label, 256, "end")
+    output = service.repeat_label(label, 4, "end")
+    assert set(_commands(output, b"\x1b\x69\x41")) == {b"\x1b\x69\x41\x04"}
+    assert all(i[3] & 0x40 for i in _commands(output, b"\x1b\x69\x4d"))
+
+
+def test_repeat_label_leaves_parts_before_the_last_uncut():
+    service = LabelPrinterService("QL-700", "tcp://127.0.0.1", None)
+    label = service.render_label(Image.new("L", (696, 100), 255), "62")
+    output = service.repeat_label(label, 2, "end", last=False)
+
+    service.validate_raster(output, "62")
+    assert not any(i[3] & 0x40 for i in _commands(output, b"\x1b\x69\x4d"))
+    assert not any(i[3] & 0x08 for i in _commands(output, b"\x1b\x69\x4b"))
+    # Parts cut after every label are cut as usual
+    output = service.repeat_label(label, 2, "each", last=False)
+    assert all(i[3] & 0x40 for i in _commands(output, b"\x1b\x69\x4d"))
+
+
+def _status_block(status_type=0x00, phase=0x00, errors=0):
+    data = bytearray(32)
+    data[0:3] = b"\x80\x20\x42"
+    data[8] = errors
+    data[10] = 62  # 62mm endless tape
+    data[11] = 0x0A
+    data[18] = status_type
+    data[19] = phase
+    return bytes(data)
+
+
+class _FakeBackend:
+    replies = []
+
+    def __init__(self, address):
+        self.replies = list(type(self).replies)
+        self.written = b""
+
+    def write(self, data):
+        self.written += data
+
+    def read(self, length):
+        return self.replies.pop(0) if self.replies else b""
+
+    def dispose(self):
+        pass
+
+
+def _printing_service(replies):
+    backend = type("Backend", (_FakeBackend,), {"replies": replies})
+    return LabelPrinterService("QL-700", "tcp://127.0.0.1", backend)
+
+
+def test_count_pages_counts_every_copy():
+    service = LabelPrinterService("QL-700", "tcp://127.0.0.1", None)
+    label = service.render_label(Image.new("L", (696, 100), 255), "62")
+
+    assert count_pages(label) == 1
+    assert count_pages(service.repeat_label(label, 3, "end")) == 3
+
+
+def test_print_raster_follows_status_until_pages_are_printed():
+    printing = _status_block(0x06, 0x01)
+    completed = _status_block(0x01)
+    service = _printing_service(
+        [_status_block(), printing, completed, printing, completed, printing]
+    )
+    label = service.render_label(Image.new("L", (696, 100), 255), "62")
+
+    status = service.print_raster(label, read_status=True, pages=2)
+    assert status["status_type"] == "Printing completed"
+    assert status["label_size"] == "62"
+
+
+def test_print_raster_stops_following_at_an_error():
+    service = _printing_service([_status_block(), _status_block(0x02, errors=0x01)])
+    label = service.render_label(Image.new("L", (696, 100), 255), "62")
+
+    status = service.print_raster(label, read_status=True, pages=2)
+    assert status["status_type"] == "Error occurred"
+    assert status["errors"] == ["No media when printing"]
+
+
+def test_print_raster_stops_asking_printers_that_do_not_answer():
+    service = _printing_service([])
+    label = service.render_label(Image.new("L", (696, 100), 255), "62")
+
+    assert service.print_raster(label, read_status=True) is None
+    assert not service.answers_status
+
+
+def test_print_raster_stops_following_printers_that_do_not_report_the_end(
+    monkeypatch,
+):
+    monkeypatch.setattr("printer_service.PRINT_STATUS_TIMEOUT", 0.1)
+    service = _printing_service([_status_block()])
+    label = service.render_label(Image.new("L", (696, 100), 255), "62")
+
+    assert service.print_raster(label, read_status=True)["label_size"] == "62"
+    assert service.answers_status and not service.reports_progress
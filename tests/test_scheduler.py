@@ -0,0 +1,126 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import PrintScheduler
+
+
+def _wait_for_waiting(scheduler, printer, count):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        waiting = scheduler.status().get(printer, {}).get("waiting", {})
+        if sum(waiting.values()) == count:
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"{count} jobs never queued for {printer}")
+
+
+def _queue_jobs(scheduler, jobs):
+    """Queue (name, priority, deadline) jobs behind a running one, in order"""
+    order = []
+    threads = []
+
+    def run(name, priority, deadline):
+        with scheduler.slot("p", priority, deadline):
+            order.append(name)
+
+    running = scheduler.slot("p")
+    with running:
+        for count, job in enumerate(jobs, 1):
+            thread = threading.Thread(target=run, args=job)
+            thread.start()
+            threads.append(thread)
+            _wait_for_waiting(scheduler, "p", count)
+    for thread in threads:
+        thread.join(5)
+    return order
+
+
+def test_idle_printer_is_granted_right_away():
+    scheduler = PrintScheduler()
+    slot = scheduler.slot("p", "bulk")
+    with slot:
+        assert scheduler.status()["p"]["busy"]
+    assert not scheduler.status()["p"]["busy"]
+    assert slot.report() == {"priority": "bulk", "queued_seconds": 0.0}
+
+
+def test_lanes_are_served_by_weight():
+    scheduler = PrintScheduler()
+    jobs = [(f"bulk{i}", "bulk", None) for i in range(3)]
+    jobs += [(f"urgent{i}", "urgent", None) for i in range(40)]
+    order = _queue_jobs(scheduler, jobs)
+
+    # One bulk job per 16 urgent ones, so bulk runs keep moving
+    assert order[0] == "urgent0"
+    bulk = [order.index(f"bulk{i}") for i in range(3)]
+    assert [b - a for a, b in zip(bulk, bulk[1:])] == [17, 17]
+    urgent = [name for name in order if name.startswith("urgent")]
+    assert urgent == [f"urgent{i}" for i in range(40)]
+
+
+def test_earliest_deadline_first_within_a_lane():
+    scheduler = PrintScheduler()
+    now = time.time()
+    jobs = [
+        ("none", "normal", None),
+        ("late", "normal", now + 3600),
+        ("soon", "normal", now + 600),
+    ]
+    assert _queue_jobs(scheduler, jobs) == ["soon", "late", "none"]
+
+
+def test_unknown_priority_is_rejected():
+    scheduler = PrintScheduler()
+    try:
+        scheduler.slot("p", "asap")
+    except ValueError as e:
+        assert "priority must be one of" in str(e)
+    else:
+        raise AssertionError("ValueError not raised")
+
+
+@pytest.mark.parametrize(
+    "priority, deadline_in, more_urgent",
+    [
+        ("bulk", None, False),
+        # Days away, so the normal run keeps the printer
+        ("bulk", 3 * 24 * 3600, False),
+        # Needs the printer now to make it (one second per label estimated)
+        ("bulk", 10, True),
+        ("normal", None, False),
+        ("normal", 3600, True),
+        ("urgent", None, True),
+    ],
+)
+def test_more_urgent_waiting(priority, deadline_in, more_urgent):
+    scheduler = PrintScheduler()
+    slot = scheduler.slot("p", "normal")
+    deadline = time.time() + deadline_in if deadline_in else None
+
+    def run():
+        with scheduler.slot("p", priority, deadline):
+            pass
+
+    with slot:
+        assert not slot.more_urgent_waiting()
+        thread = threading.Thread(target=run)
+        thread.start()
+        _wait_for_waiting(scheduler, "p", 1)
+        assert slot.more_urgent_waiting() == more_urgent
+    thread.join(5)
+
+
+def test_report_flags_deadline_at_risk():
+    scheduler = PrintScheduler()
+    slot = scheduler.slot("p", deadline=time.time() - 1)
+    with slot:
+        pass
+
+    report = slot.report()
+    assert report["deadline_at_risk"] and report["deadline_missed"]
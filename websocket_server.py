@@ -0,0 +1,251 @@
+import asyncio
+import json
+import logging
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Parameters a connection can set once with a "defaults" message
+JOB_PARAMETERS = (
+    "printer",
+    "label_size",
+    "threshold",
+    "rotate",
+    "copies",
+    "cut",
+    "raster",
+    "prerasterized",
+    "priority",
+    "deadline",
+)
+
+
+def parse_job_frame(frame: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """
+    Split a job frame into its parameters and payload
+
+    A frame is a 2 byte big-endian header length, a JSON object with the job
+    parameters and the image file or raster data.
+
+    Raises:
+        ValueError: If the frame is malformed
+    """
+    if len(frame) < 2:
+        raise ValueError("Frame too short")
+    (header_length,) = struct.unpack_from(">H", frame)
+    if len(frame) < 2 + header_length:
+        raise ValueError("Frame shorter than its header")
+    params = {}
+    if header_length:
+        params = json.loads(frame[2 : 2 + header_length])
+        if not isinstance(params, dict):
+            raise ValueError("Frame header must be a JSON object")
+    payload = frame[2 + header_length :]
+    if not payload:
+        raise ValueError("Image data is required")
+    return params, payload
+
+
+class WebSocketPrintServer:
+    """Long-lived WebSocket connections for clients printing many labels
+
+    Every binary frame is one job (see parse_job_frame); its parameters are
+    merged over the connection defaults. Jobs are acknowledged as soon as
+    they are queued and the jobs of a connection are printed one after the
+    other, in order, while the client keeps sending; completion and error
+    events are sent back as text frames.
+
+    admit(client_id, nbytes) is called for every frame as it arrives and
+    returns a ticket holding the frame's bytes until its job is done (see
+    AdmissionController.admit); frames it rejects get an error event.
+    handle_job(params, payload, client_id, ticket) runs in a worker thread,
+    returns the fields of the "done" event and raises to report an error. Clients
+    are identified by their address, or with trust_client_id by their
+    X-Client-Id header.
+    """
+
+    def __init__(
+        self,
+        handle_job: Callable[
+            [Dict[str, Any], bytes, Optional[str], Any], Dict[str, Any]
+        ],
+        admit: Callable[[Optional[str], int], Any],
+        host: str = "0.0.0.0",
+        port: int = 8014,
+        max_pipeline: int = 32,
+        max_frame_bytes: int = 16 * 1024 * 1024,
+        workers: int = 16,
+        trust_client_id: bool = False,
+    ):
+        self.handle_job = handle_job
+        self.admit = admit
+        self.host = host
+        self.port = port
+        self.max_pipeline = max_pipeline
+        self.max_frame_bytes = max_frame_bytes
+        self.trust_client_id = trust_client_id
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="websocket-job"
+        )
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopped: Optional[asyncio.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started = threading.Event()
+        self._start_error: Optional[Exception] = None
+
+    def start(self):
+        """
+        Start serving in a background thread
+
+        Raises:
+            OSError: If the port cannot be bound
+        """
+        self._thread = threading.Thread(
+            target=self._run, name="websocket-server", daemon=True
+        )
+        self._thread.start()
+        self._started.wait()
+        if self._start_error:
+            self._thread.join()
+            self._thread = self._loop = None
+            raise self._start_error
+        logger.info(f"WebSocket print channel listening on {self.host}:{self.port}")
+
+    def stop(self):
+        """Stop accepting jobs and wait for queued jobs to be printed"""
+        if self._loop and self._stopped:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread:
+            self._thread.join()
+        self._executor.shutdown()
+
+    def _run(self):
+        try:
+            asyncio.run(self._serve())
+        except Exception as e:
+            if self._started.is_set():
+                logger.error(f"WebSocket print channel failed: {e}")
+            else:
+                self._start_error = e
+        finally:
+            self._started.set()
+
+    async def _serve(self):
+        from websockets.asyncio.server import serve
+
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        async with serve(
+            self._handle_connection,
+            self.host,
+            self.port,
+            max_size=self.max_frame_bytes,
+        ) as server:
+            if not self.port:
+                self.port = server.sockets[0].getsockname()[1]
+            self._started.set()
+            await self._stopped.wait()
+
+    async def _handle_connection(self, websocket):
+        from websockets.exceptions import ConnectionClosed
+
+        client_id = websocket.remote_address[0] if websocket.remote_address else None
+        if self.trust_client_id:
+            client_id = websocket.request.headers.get("X-Client-Id") or client_id
+        defaults: Dict[str, Any] = {}
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_pipeline)
+        worker = asyncio.create_task(self._print_jobs(websocket, queue, client_id))
+        next_id = 0
+
+        try:
+            async for message in websocket:
+                if isinstance(message, str):
+                    await self._handle_control(websocket, message, defaults)
+                    continue
+
+                next_id += 1
+                try:
+                    params, payload = parse_job_frame(message)
+                except ValueError as e:
+                    await websocket.send(
+                        json.dumps({"type": "error", "id": next_id, "error": str(e)})
+                    )
+                    continue
+                job_ref = params.pop("id", next_id)
+
+                # The frame is admitted while it is held, not when it prints
+                try:
+                    ticket = self.admit(client_id, len(message))
+                except Exception as e:
+                    await websocket.send(json.dumps(self._error_event(job_ref, e)))
+                    continue
+
+                # Waits here (and stops reading) while the pipeline is full
+                await queue.put((job_ref, {**defaults, **params}, payload, ticket))
+                await websocket.send(
+                    json.dumps({"type": "ack", "id": job_ref, "queued": queue.qsize()})
+                )
+        except ConnectionClosed:
+            pass
+        finally:
+            # Jobs already acknowledged are still printed
+            await queue.put(None)
+            await worker
+
+    async def _handle_control(self, websocket, message: str, defaults: Dict[str, Any]):
+        """Handle a text frame: {"type": "defaults", ...job parameters}"""
+        try:
+            data = json.loads(message)
+            if not isinstance(data, dict) or data.get("type") != "defaults":
+                raise ValueError("Unknown message type")
+            unknown = [k for k in data if k != "type" and k not in JOB_PARAMETERS]
+            if unknown:
+                raise ValueError(f"Unknown parameters: {', '.join(unknown)}")
+        except ValueError as e:
+            await websocket.send(json.dumps({"type": "error", "error": str(e)}))
+            return
+
+        defaults.clear()
+        defaults.update({k: v for k, v in data.items() if k != "type"})
+        await websocket.send(json.dumps({"type": "defaults", "defaults": defaults}))
+
+    async def _print_jobs(self, websocket, queue: asyncio.Queue, client_id):
+        """Print the queued jobs of one connection in order"""
+        from websockets.exceptions import ConnectionClosed
+
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            job_ref, params, payload, ticket = item
+            try:
+                result = await loop.run_in_executor(
+                    self._executor,
+                    self.handle_job,
+                    params,
+                    payload,
+                    client_id,
+                    ticket,
+                )
+                event = {"type": "done", "id": job_ref, **result}
+            except Exception as e:
+                logger.error(f"WebSocket job {job_ref} from {client_id} failed: {e}")
+                event = self._error_event(job_ref, e)
+            finally:
+                ticket.release()
+            try:
+                await websocket.send(json.dumps(event))
+            except ConnectionClosed:
+                pass
+
+    @staticmethod
+    def _error_event(job_ref, error: Exception) -> Dict[str, Any]:
+        event = {"type": "error", "id": job_ref, "error": str(error)}
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after:
+            event["retry_after"] = retry_after
+        return event